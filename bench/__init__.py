@@ -0,0 +1 @@
+# empty init so Python treats this as a package
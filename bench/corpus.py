@@ -0,0 +1,106 @@
+import random
+from io import BytesIO
+from typing import List, Tuple
+
+from docx import Document
+
+_WORDS = (
+    "budget finance planning forecast department expenditure revenue policy "
+    "assumption consolidation variance approval ministry agency vote scheme "
+    "governance dashboard reconciliation procurement audit treasury allocation "
+    "operating development capital manpower efficiency digital automation "
+    "stakeholder timeline milestone benefit savings process workflow review"
+).split()
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < 0.2:
+        words.append(f"{rng.randint(1, 3)}.{rng.randint(1, 9)}.{rng.randint(1, 9)}")
+    return " ".join(words).capitalize() + "."
+
+def paragraphs(rng: random.Random, n: int) -> List[str]:
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(3, 6))) for _ in range(n)]
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """Minimal multi-page PDF with Helvetica text that PyPDF2 can extract."""
+    objects: List[bytes] = []
+    n_pages = len(pages)
+    # 1 catalog, 2 page tree, 3 font, then (page, content) pairs.
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(pages):
+        ops = ["BT /F1 10 Tf 12 TL 40 800 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) '")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines, cur = [], ""
+    for word in text.split():
+        if cur and len(cur) + len(word) + 1 > width:
+            lines.append(cur)
+            cur = word
+        else:
+            cur = f"{cur} {word}".strip()
+    if cur:
+        lines.append(cur)
+    return lines
+
+def make_corpus(seed: int, n_files: int, pages_per_file: int) -> List[Tuple[bytes, str]]:
+    """Mixed PDF/DOCX/TXT files of roughly ``pages_per_file`` pages each."""
+    rng = random.Random(seed)
+    files: List[Tuple[bytes, str]] = []
+    for i in range(n_files):
+        kind = ("pdf", "docx", "txt")[i % 3]
+        page_paras = [paragraphs(rng, 4) for _ in range(pages_per_file)]
+        if kind == "pdf":
+            pages = [[line for p in paras for line in _wrap(p) + [""]] for paras in page_paras]
+            files.append((make_pdf(pages), f"doc_{i:03d}.pdf"))
+        elif kind == "docx":
+            doc = Document()
+            for paras in page_paras:
+                for p in paras:
+                    doc.add_paragraph(p)
+                doc.add_page_break()
+            buf = BytesIO()
+            doc.save(buf)
+            files.append((buf.getvalue(), f"doc_{i:03d}.docx"))
+        else:
+            text = "\n\n".join(p for paras in page_paras for p in paras)
+            files.append((text.encode("utf-8"), f"doc_{i:03d}.txt"))
+    return files
+
+def make_png(seed: int, size: int = 1024) -> bytes:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    img = Image.new("RGB", (size, size), (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    for _ in range(200):
+        x, y = rng.randrange(size), rng.randrange(size)
+        img.paste((rng.randint(0, 255),) * 3, (x, y, min(size, x + 40), min(size, y + 40)))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
@@ -0,0 +1,96 @@
+"""Import-time report for the app's core modules.
+
+Run from the repository root::
+
+    python -m bench.import_times
+    python -m bench.import_times core.rag core.llm --top 15 --json out.json
+
+Each module is imported in a fresh interpreter with ``-X importtime``, so the
+numbers are cold-start costs. The "heavy" column lists the optional heavy
+packages a plain import pulled in; pages only need them once a feature runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    "core.metrics",
+    "core.cache",
+    "core.providers",
+    "core.llm",
+    "core.export",
+    "core.rag",
+    "core.segments",
+]
+HEAVY = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "langchain_text_splitters",
+         "faiss", "numpy", "openai", "tiktoken", "PyPDF2", "docx", "PIL")
+
+def profile(module: str) -> Dict:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - t0
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, raw = line[len("import time:"):].split("|")
+        # Nesting is shown as two extra spaces per level after the first.
+        depth = (len(raw) - len(raw.lstrip()) - 1) // 2
+        rows.append(
+            {"module": raw.strip(), "depth": depth, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000}
+        )
+    loaded = {r["module"].split(".")[0] for r in rows}
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "wall_ms": round(wall * 1000, 1),
+        "import_ms": round(sum(r["self_ms"] for r in rows), 1),
+        "heavy": sorted(p for p in HEAVY if p in loaded),
+        "top": sorted(
+            (
+                {"module": r["module"], "cumulative_ms": round(r["cumulative_ms"], 1)}
+                for r in rows
+                if r["depth"] <= 1 and r["module"] != module
+            ),
+            key=lambda r: r["cumulative_ms"],
+            reverse=True,
+        ),
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=TARGETS)
+    parser.add_argument("--top", type=int, default=8, help="heaviest top-level imports to list per module")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = [profile(m) for m in args.modules]
+    print(f"{'module':18} {'import ms':>10} {'wall ms':>10}  heavy")
+    for r in report:
+        if not r["ok"]:
+            print(f"{r['module']:18} {'failed':>10} {r['wall_ms']:10.1f}  {r['error']}")
+            continue
+        print(f"{r['module']:18} {r['import_ms']:10.1f} {r['wall_ms']:10.1f}  {', '.join(r['heavy']) or '-'}")
+    for r in report:
+        if r["ok"] and args.top:
+            print(f"\n{r['module']}: heaviest imports")
+            for t in r["top"][: args.top]:
+                print(f"  {t['cumulative_ms']:10.1f} ms  {t['module']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"python": sys.version.split()[0], "results": report}, fh, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Offline benchmarks for the ingest, retrieval and export hot paths.
+
+Run from the repository root::
+
+    python -m bench.run --sizes small,medium
+    python -m bench.run --sizes small --compare bench/results/<earlier>.json
+
+The local provider (``LLM_PROVIDER=local``) stands in for the API so nothing
+touches the network, and everything is written into a temporary working
+directory.
+Peak memory comes from tracemalloc, which slows Python code down; pass
+``--no-memory`` for timings only.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+from bench.corpus import make_corpus, make_png, paragraphs  # noqa: E402
+from core.local_embeddings import LocalEmbeddings  # noqa: E402
+
+# name -> (files, pages per file)
+SIZES = {"small": (6, 5), "medium": (12, 25), "large": (24, 100)}
+N_QUERIES = 50
+
+def _latency(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    if not ms:
+        return {}
+
+    def pct(p: float) -> float:
+        return round(ms[min(len(ms) - 1, int(round(p / 100 * (len(ms) - 1))))], 4)
+
+    return {
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "mean": round(statistics.fmean(ms), 4),
+        "max": round(ms[-1], 4),
+    }
+
+class Stage:
+    """Times a block, optionally tracking peak traced memory."""
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.samples: List[float] = []
+        self.peak_mb: Optional[float] = None
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self._t0 = time.perf_counter()
+        return self
+
+    def call(self, fn: Callable, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.samples.append(time.perf_counter() - t0)
+        return out
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._t0
+        if self.trace:
+            self.peak_mb = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+            tracemalloc.stop()
+        return False
+
+def _record(size: str, stage: str, st: Stage, n: int, unit: str, **extra) -> Dict:
+    rec = {
+        "size": size,
+        "stage": stage,
+        "n": n,
+        "seconds": round(st.seconds, 4),
+        "throughput": round(n / st.seconds, 3) if st.seconds else None,
+        "unit": f"{unit}/s",
+        "latency_ms": _latency(st.samples),
+        "peak_mb": st.peak_mb,
+    }
+    rec.update(extra)
+    return rec
+
+def _case_markdown(seed: int) -> str:
+    import random
+
+    rng = random.Random(seed)
+    out = ["# Synthetic Case Study", ""]
+    for heading in (
+        "Executive Summary",
+        "Problem / Need",
+        "Implementation Approach",
+        "Benefits & Impact",
+        "Key Learning Points",
+        "Point of Contact",
+    ):
+        out += [f"## {heading}", ""]
+        for p in paragraphs(rng, 4):
+            out += [p, "", f"- {p[:80]}", ""]
+    return "\n".join(out)
+
+def run_size(size: str, trace: bool, fake: LocalEmbeddings) -> List[Dict]:
+    from core import export, rag
+
+    n_files, pages = SIZES[size]
+    files = make_corpus(seed=len(size), n_files=n_files, pages_per_file=pages)
+    total_mb = sum(len(raw) for raw, _ in files) / 2 ** 20
+    out: List[Dict] = []
+
+    with Stage(trace) as st:
+        texts = [st.call(rag.extract_text, raw, name) for raw, name in files]
+    out.append(_record(size, "extract_text", st, len(files), "files", input_mb=round(total_mb, 3)))
+
+    with Stage(False) as st:
+        st.call(rag.extract_texts_parallel, files)
+    out.append(_record(size, "extract_texts_parallel", st, len(files), "files", workers=rag.EXTRACT_WORKERS))
+
+    with Stage(trace) as st:
+        chunks = [st.call(rag._split_text, t) for t in texts]
+    n_chunks = sum(len(c) for c in chunks)
+    out.append(_record(size, "_split_text", st, sum(len(t) for t in texts), "chars", chunks=n_chunks))
+
+    namespace = f"bench-{size}"
+    docs = [
+        {"segments": rag.iter_segments(raw, name), "meta": {"filename": name}}
+        for raw, name in files
+    ]
+    before = fake.texts
+    with Stage(trace) as st:
+        st.call(rag.upsert_documents, docs, namespace=namespace)
+    out.append(_record(size, "upsert_documents", st, n_chunks, "chunks", embedded=fake.texts - before))
+
+    docs = [
+        {"segments": rag.iter_segments(raw, name), "meta": {"filename": name}}
+        for raw, name in files
+    ]
+    before = fake.texts
+    with Stage(trace) as st:
+        st.call(rag.upsert_documents, docs, namespace=f"{namespace}-again")
+    out.append(
+        _record(size, "upsert_documents (embedding cache warm)", st, n_chunks, "chunks", embedded=fake.texts - before)
+    )
+
+    questions = []
+    for i, chunk in enumerate(c for cs in chunks for c in cs):
+        if len(questions) >= N_QUERIES:
+            break
+        sentences = chunk.split(". ")
+        questions.append(sentences[i % len(sentences)][:120])
+    for mode in ("vector", "lexical", "hybrid"):
+        with Stage(False) as st:
+            for q in questions:
+                st.call(rag.query, f"{mode}: {q}", k=8, namespace=namespace, mode=mode)
+        out.append(_record(size, f"query[{mode}]", st, len(questions), "queries"))
+    with Stage(False) as st:
+        for q in questions:
+            st.call(rag.query, f"hybrid: {q}", k=8, namespace=namespace, mode="hybrid")
+    out.append(_record(size, "query[hybrid, repeated]", st, len(questions), "queries"))
+
+    sections = export.parse_sections(_case_markdown(len(size)))
+    images = {f"diagram {i}": make_png(i) for i in range(3)}
+    placement = {p: "Implementation Approach" for p in images}
+    placement["__COVER__"] = "Title"
+    cover = make_png(99)
+    with Stage(trace) as st:
+        for _ in range(3):
+            buf = st.call(
+                export.build_docx_from_sections,
+                sections=sections,
+                placement=placement,
+                cover_img=cover,
+                diag_imgs=images,
+                selected_bps=[],
+            )
+    out.append(
+        _record(size, "build_docx_from_sections", st, 3, "documents", docx_mb=round(len(buf.getvalue()) / 2 ** 20, 3))
+    )
+
+    from core.blobs import get_blob_store
+
+    store = get_blob_store()
+    cover_handle = store.put(cover)
+    handles = {p: store.put(img) for p, img in images.items()}
+    with Stage(trace) as st:
+        for _ in range(3):
+            handle = st.call(export.export_docx, sections, placement, cover_handle, handles, [])
+    out.append(
+        _record(
+            size, "export_docx (memoized)", st, 3, "documents",
+            docx_mb=round(os.path.getsize(store.path(handle)) / 2 ** 20, 3),
+        )
+    )
+
+    try:
+        report = rag.index_report(namespace, n_queries=20, k=8)
+    except Exception as e:
+        report = [{"error": str(e)}]
+    out.append({"size": size, "stage": "index_report", "rows": report})
+    return out
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, text=True).strip()
+    except Exception:
+        return None
+
+def compare(old: Dict, new: Dict):
+    def key(r):
+        return (r["size"], r["stage"])
+
+    before = {key(r): r for r in old.get("results", []) if "throughput" in r}
+    print(f"{'size':8} {'stage':42} {'before':>12} {'after':>12} {'change':>8}")
+    for r in new["results"]:
+        prev = before.get(key(r))
+        if not prev or not prev.get("throughput") or not r.get("throughput"):
+            continue
+        change = (r["throughput"] / prev["throughput"] - 1) * 100
+        print(f"{r['size']:8} {r['stage']:42} {prev['throughput']:12.2f} {r['throughput']:12.2f} {change:+7.1f}%")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="small,medium", help=f"comma list of {', '.join(SIZES)}")
+    parser.add_argument("--out", default=os.path.join(REPO, "bench", "results"))
+    parser.add_argument("--compare", help="earlier results JSON to compare throughput against")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc peak memory")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    os.environ["LLM_PROVIDER"] = "local"
+    from core.providers import get_provider
+
+    fake = get_provider().embeddings("")
+    results: List[Dict] = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="leapscribe-bench-") as work:
+        # All app paths are relative ("data/..."), so a temp cwd isolates them.
+        os.chdir(work)
+        try:
+            for size in sizes:
+                print(f"[bench] {size} ...", flush=True)
+                results.extend(run_size(size, trace=not args.no_memory, fake=fake))
+        finally:
+            os.chdir(cwd)
+
+    doc = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "memory_traced": not args.no_memory,
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(doc, fh, indent=2)
+    print(f"[bench] wrote {path}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            compare(json.load(fh), doc)
+
+if __name__ == "__main__":
+    main()
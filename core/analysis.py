@@ -0,0 +1,171 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.metrics import bind_session, span
+from core.prompts import fact_sheet_prompt, missing_info_prompt
+
+# Text per map call, in approximate tokens (4 characters each).
+GROUP_TOKENS = int(os.getenv("ANALYSIS_GROUP_TOKENS", "3000"))
+# Map calls per upload; beyond this, groups grow instead of multiplying...
+MAX_GROUPS = int(os.getenv("ANALYSIS_MAX_GROUPS", "24"))
+# ...but never past this, so every map prompt fits the model's context.
+MAX_GROUP_TOKENS = int(os.getenv("ANALYSIS_MAX_GROUP_TOKENS", "12000"))
+FACT_TOKENS = 250
+# Fact sheets sent to the reduce call, in total. More than this are merged
+# into fewer, combined sheets first, level by level.
+REDUCE_TOKENS = 4000
+MAX_REDUCE_LEVELS = 3
+MAP_WORKERS = 8
+CHARS_PER_TOKEN = 4
+
+def _pieces(text: str, max_chars: int) -> List[str]:
+    # Paragraphs packed up to max_chars; an oversized paragraph is cut.
+    out: List[str] = []
+    buf = ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        while len(para) > max_chars:
+            if buf:
+                out.append(buf)
+                buf = ""
+            out.append(para[:max_chars])
+            para = para[max_chars:]
+        if not para:
+            continue
+        if buf and len(buf) + len(para) + 2 > max_chars:
+            out.append(buf)
+            buf = ""
+        buf = f"{buf}\n\n{para}" if buf else para
+    if buf:
+        out.append(buf)
+    return out
+
+def chunk_groups(docs: Sequence[Tuple[str, str]], group_tokens: int = GROUP_TOKENS) -> List[Dict]:
+    """Pack (filename, text) documents into groups of about ``group_tokens``.
+
+    A long document is split across groups, short ones share a group. Groups
+    grow to keep an upload within MAX_GROUPS map calls, up to MAX_GROUP_TOKENS
+    each; past that the number of groups grows with the upload.
+    """
+    total = sum(len(text) for _, text in docs)
+    max_chars = max(group_tokens * CHARS_PER_TOKEN, -(-total // MAX_GROUPS))
+    max_chars = min(max_chars, MAX_GROUP_TOKENS * CHARS_PER_TOKEN)
+    groups: List[Dict] = []
+    for filename, text in docs:
+        for piece in _pieces(text, max_chars):
+            last = groups[-1] if groups else None
+            if last and len(last["text"]) + len(piece) + 2 <= max_chars:
+                if filename not in last["sources"]:
+                    last["sources"].append(filename)
+                last["text"] += f"\n\n[{filename}]\n{piece}"
+            else:
+                groups.append({"sources": [filename], "text": f"[{filename}]\n{piece}"})
+    return groups
+
+def _summarize_groups(
+    groups: List[Dict],
+    model: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[List[Optional[str]], List[Exception]]:
+    # One fact sheet per group, concurrently; a failed group gets None.
+    from core.llm import chat
+
+    max_words = FACT_TOKENS * 3 // 4
+
+    def summarize(group: Dict) -> str:
+        prompt = fact_sheet_prompt(group["text"], ", ".join(group["sources"]), max_words)
+        sheet = chat([{"role": "user", "content": prompt}], model=model, cache=True, max_tokens=FACT_TOKENS)
+        return f"[{', '.join(group['sources'])}]\n{sheet.strip()}"
+
+    sheets: List[Optional[str]] = [None] * len(groups)
+    errors: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(MAP_WORKERS, len(groups)))) as pool:
+        futures = {pool.submit(bind_session(summarize), g): i for i, g in enumerate(groups)}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                sheets[futures[future]] = future.result()
+            except Exception as e:
+                errors.append(e)
+            if progress:
+                progress(done, len(groups))
+    return sheets, errors
+
+def fact_sheets(
+    docs: Sequence[Tuple[str, str]],
+    model: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[List[str], List[str]]:
+    """One compact fact sheet per chunk group, in upload order.
+
+    Returns (sheets, failed) where ``failed`` names the sources of groups
+    whose map call failed; they are left out rather than failing the whole
+    analysis. Raises only if every group fails.
+    """
+    from core.llm import CHAT_MODEL
+
+    groups = chunk_groups(docs)
+    sheets, errors = _summarize_groups(groups, model or CHAT_MODEL, progress)
+    if groups and len(errors) == len(groups):
+        raise errors[0]
+    failed = [", ".join(g["sources"]) for g, sheet in zip(groups, sheets) if sheet is None]
+    return [s for s in sheets if s], list(dict.fromkeys(failed))
+
+def _merge_sheets(sheets: List[str], model: str) -> List[str]:
+    """Summarise fact sheets into fewer combined ones until they fit REDUCE_TOKENS."""
+    from core.rag import count_tokens, truncate_tokens
+
+    for level in range(1, MAX_REDUCE_LEVELS + 1):
+        if len(sheets) <= 1 or count_tokens("\n\n".join(sheets), model) <= REDUCE_TOKENS:
+            break
+        groups = []
+        for i, sheet in enumerate(chunk_groups([(f"sheet {n}", s) for n, s in enumerate(sheets, 1)])):
+            sheet["sources"] = [f"combined fact sheets, level {level}, part {i + 1}"]
+            groups.append(sheet)
+        merged, _ = _summarize_groups(groups, model)
+        # A failed merge keeps its input, cut to one sheet's length.
+        sheets = [m or truncate_tokens(g["text"], FACT_TOKENS, model) for g, m in zip(groups, merged)]
+    return sheets
+
+def _fit(sheets: List[str], max_tokens: int, model: str) -> str:
+    from core.rag import count_tokens, truncate_tokens
+
+    joined = "\n\n".join(sheets)
+    if count_tokens(joined, model) <= max_tokens:
+        return joined
+    # Every sheet keeps an equal share, so no document drops out entirely.
+    share = max(1, max_tokens // len(sheets))
+    return "\n\n".join(truncate_tokens(s, share, model) for s in sheets)
+
+def missing_info_questions(
+    docs: Sequence[Tuple[str, str]],
+    model: Optional[str] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[str, List[str], List[str]]:
+    """Missing-information questions over all of ``docs``.
+
+    Returns (raw reply, fact sheets, sources whose map call failed). Uploads
+    that fit in one group go straight to the question prompt. Larger ones are
+    mapped to fact sheets first, merged level by level while they exceed
+    REDUCE_TOKENS, and the questions come from a single call over the result.
+    """
+    from core.llm import CHAT_MODEL, chat
+
+    model = model or CHAT_MODEL
+    docs = [(name, text) for name, text in docs if text and text.strip()]
+    with span("analysis.missing_info", documents=len(docs)) as m:
+        total = sum(len(text) for _, text in docs)
+        failed: List[str] = []
+        if total <= GROUP_TOKENS * CHARS_PER_TOKEN:
+            sheets: List[str] = []
+            prompt = missing_info_prompt("\n\n".join(f"[{name}]\n{text}" for name, text in docs))
+        else:
+            sheets, failed = fact_sheets(docs, model=model, progress=progress)
+            prompt = missing_info_prompt(
+                _fit(_merge_sheets(sheets, model), REDUCE_TOKENS, model),
+                label="Fact sheets covering all uploaded material",
+            )
+        m["groups"] = len(sheets)
+        m["failed_groups"] = len(failed)
+        return chat([{"role": "user", "content": prompt}], model=model, cache=True), sheets, failed
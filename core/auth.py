@@ -15,3 +15,22 @@ def require_password():
         else:
             st.error("Wrong password.")
     st.stop()
+
+def require_admin():
+    """Second gate for process-wide admin pages, against ``METRICS_ADMIN_PASSWORD``."""
+    if st.session_state.get("admin"):
+        return True
+
+    expected = st.secrets.get("METRICS_ADMIN_PASSWORD", "")
+    if not expected:
+        st.info("Admin pages are disabled. Set `METRICS_ADMIN_PASSWORD` in the app secrets to enable them.")
+        st.stop()
+    st.markdown("### 🛡️ Admin access required")
+    pw = st.text_input("Enter admin password", type="password", key="admin_pw")
+    if st.button("Unlock admin"):
+        if pw == expected:
+            st.session_state.admin = True
+            st.rerun()
+        else:
+            st.error("Wrong password.")
+    st.stop()
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+BLOB_DIR = "data/blobs"
+BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(1024 ** 3)))
+THUMB_PX = 384
+# Reads refresh a blob's mtime (its LRU clock) at most this often.
+TOUCH_SECONDS = 60
+
+_HANDLE_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def downscale_jpeg(data: bytes, max_px: int, quality: int = 85) -> bytes:
+    """Re-encode an image as JPEG no larger than ``max_px`` on either side."""
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as img:
+        img.thumbnail((max_px, max_px))
+        if img.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white rather than JPEG's default black.
+            rgba = img.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.split()[-1])
+            img = flat
+        buf = BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+class BlobStore:
+    """Content-addressed files on local disk, evicted least recently used first.
+
+    A handle is the sha256 of the content, so the same image stored by several
+    sessions takes space once. Derived thumbnails live next to their source
+    and are evicted by the same rule.
+    """
+
+    def __init__(self, root: str = BLOB_DIR, max_bytes: int = BLOB_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str, suffix: str = ".bin") -> str:
+        if not _HANDLE_RE.match(handle or ""):
+            raise ValueError(f"Invalid blob handle: {handle!r}")
+        return os.path.join(self.root, handle[:2], handle + suffix)
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        out = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+        self._account(len(data))
+
+    def _account(self, size: int):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(s for _, s, _ in self._files())
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Down to 90% of the limit, so a full store does not rescan on every put.
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evicted += 1
+        self._total = total
+
+    @staticmethod
+    def _touch(path: str):
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_SECONDS:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def put(self, data: bytes) -> str:
+        handle = hashlib.sha256(data).hexdigest()
+        path = self._path(handle)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._write(path, data)
+        return handle
+
+    def put_file(self, src: str) -> str:
+        """Move the file at ``src`` into the store without reading it into memory."""
+        digest = hashlib.sha256()
+        with open(src, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(block)
+        handle = digest.hexdigest()
+        path = self._path(handle)
+        if os.path.exists(path):
+            os.remove(src)
+            os.utime(path)
+            return handle
+        size = os.path.getsize(src)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src, path)
+        self._account(size)
+        return handle
+
+    def path(self, handle: str) -> Optional[str]:
+        """Filesystem path of a stored blob, or None if it has been evicted."""
+        path = self._path(handle)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def get(self, handle: str) -> Optional[bytes]:
+        """The stored bytes, or None if the blob has been evicted."""
+        path = self._path(handle)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(path)
+        return data
+
+    def exists(self, handle: str) -> bool:
+        return os.path.exists(self._path(handle))
+
+    def thumbnail(self, handle: str, max_px: int = THUMB_PX) -> Optional[bytes]:
+        """A JPEG no larger than ``max_px`` on either side, made once and kept on disk."""
+        path = self._path(handle, f".t{max_px}.jpg")
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            self._touch(path)
+            return data
+        except FileNotFoundError:
+            pass
+        src = self.get(handle)
+        if src is None:
+            return None
+        data = downscale_jpeg(src, max_px)
+        self._write(path, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._files())
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+_BLOB_STORE: Optional[BlobStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    global _BLOB_STORE
+    with _STORE_LOCK:
+        if _BLOB_STORE is None:
+            _BLOB_STORE = BlobStore()
+        return _BLOB_STORE
@@ -0,0 +1,81 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from core.metrics import bind_session, span
+from core.prompts import DRAFT_SECTIONS, retrieval_query, section_prompt, title_prompt
+
+SECTION_K = 8
+SECTION_CONTEXT_TOKENS = 1200
+TITLE_CONTEXT_TOKENS = 800
+
+_LEADING_HEADING = re.compile(r"^\s*(#{1,6}[^\n]*\n+)+")
+
+def section_query(heading: str, focus: str, topic_hint: str) -> str:
+    return f"{heading}: {focus}\n\n{topic_hint}".strip()
+
+def _clean_section(text: str) -> str:
+    # Models sometimes repeat the heading they were asked to leave out.
+    return _LEADING_HEADING.sub("", (text or "").strip() + "\n").strip()
+
+def _clean_title(text: str) -> str:
+    line = next((l for l in (text or "").splitlines() if l.strip()), "Case Study")
+    line = re.sub(r"^[\s#*]*(title\s*:)?", "", line, flags=re.I)
+    return line.strip().strip("*\"'").strip() or "Case Study"
+
+def stitch(title: str, sections: Dict[str, str]) -> str:
+    """``# Title`` then one ``## Heading`` per section, in DRAFT_SECTIONS order."""
+    parts = [f"# {title}"]
+    for heading, _, _ in DRAFT_SECTIONS:
+        if heading in sections:
+            parts.append(f"## {heading}\n{sections[heading]}")
+    return "\n\n".join(parts) + "\n"
+
+def draft_sections(
+    answers: Dict[str, str],
+    topic_hint: str,
+    namespace: Optional[str],
+    model: Optional[str] = None,
+    on_section: Optional[Callable[[str, str], None]] = None,
+    cache: bool = False,
+) -> str:
+    """Draft every section concurrently, each from its own focused retrieval.
+
+    The title is drafted alongside from the general query. ``on_section`` is
+    called with (heading, body) as each section finishes, in completion order
+    and on the calling thread. ``cache`` serves repeated identical calls from
+    the response cache; off by default so drafting again gives a new draft.
+    Returns the stitched Markdown.
+    """
+    from core.llm import CHAT_MODEL, chat
+    from core.rag import build_context, query
+
+    model = model or CHAT_MODEL
+
+    def draft(heading: str, focus: str, instructions: str) -> str:
+        hits = query(section_query(heading, focus, topic_hint), k=SECTION_K, namespace=namespace)
+        context_text = build_context(hits, max_tokens=SECTION_CONTEXT_TOKENS, model=model) or "(no retrieved context)"
+        prompt = section_prompt(heading, instructions, context_text, answers)
+        return _clean_section(chat([{"role": "user", "content": prompt}], model=model, cache=cache))
+
+    def draft_title() -> str:
+        hits = query(retrieval_query(answers, topic_hint), k=SECTION_K, namespace=namespace)
+        context_text = build_context(hits, max_tokens=TITLE_CONTEXT_TOKENS, model=model) or "(no retrieved context)"
+        return _clean_title(chat([{"role": "user", "content": title_prompt(context_text, answers)}], model=model, cache=cache))
+
+    sections: Dict[str, str] = {}
+    with span("draft.sections", sections=len(DRAFT_SECTIONS)):
+        # One thread per section; core.llm.api_slot() applies any API limit.
+        with ThreadPoolExecutor(max_workers=len(DRAFT_SECTIONS) + 1) as pool:
+            title_future = pool.submit(bind_session(draft_title))
+            futures = {pool.submit(bind_session(draft), *spec): spec[0] for spec in DRAFT_SECTIONS}
+            for future in as_completed(futures):
+                heading = futures[future]
+                sections[heading] = future.result()
+                if on_section:
+                    on_section(heading, sections[heading])
+            title = title_future.result()
+    return stitch(title, sections)
+
+def section_headings() -> List[str]:
+    return [heading for heading, _, _ in DRAFT_SECTIONS]
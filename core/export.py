@@ -0,0 +1,229 @@
+import json
+import os
+import tempfile
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from core.blobs import downscale_jpeg, get_blob_store
+from core.cache import LRUCache, text_hash
+from core.metrics import span
+
+SECTION_ORDER = [
+    "Title",
+    "Executive Summary",
+    "Problem / Need",
+    "Implementation Approach",
+    "Benefits & Impact",
+    "Key Learning Points",
+    "Point of Contact",
+]
+
+IMAGE_WIDTH_IN = 5.5
+# Images are embedded at this resolution; 1024px PNGs at 5.5in are ~186 DPI.
+EXPORT_DPI = int(os.getenv("EXPORT_IMAGE_DPI", "150"))
+
+_SECTIONS = LRUCache(64)
+# Export key -> blob handle of the finished .docx.
+_EXPORTS = LRUCache(256)
+
+def print_px() -> int:
+    return int(IMAGE_WIDTH_IN * EXPORT_DPI)
+
+def prepare_image(img_bytes: bytes) -> bytes:
+    return downscale_jpeg(img_bytes, print_px())
+
+def default_placement(has_cover: bool, diagram_prompts) -> Dict[str, str]:
+    mapping = {}
+    if has_cover:
+        mapping["__COVER__"] = "Title"
+    for prompt in diagram_prompts:
+        mapping[prompt] = "Implementation Approach"
+    return mapping
+
+def parse_sections(md: str):
+    """Split case study markdown into SECTION_ORDER buckets of raw lines.
+
+    Parsed results are memoized on the text; callers get their own copy.
+    """
+    key = text_hash(md)
+    cached = _SECTIONS.get(key)
+    if cached is None:
+        cached = _parse_sections(md)
+        _SECTIONS.put(key, cached)
+    return {k: list(v) for k, v in cached.items()}
+
+def _parse_sections(md: str):
+    sections = {"Title": []}
+    current = "Title"
+    for raw_line in md.splitlines():
+        line = raw_line.strip()
+        if line.startswith("# "):
+            sections["Title"] = [line[2:].strip()]
+            current = "Title"
+            continue
+        if line.startswith("## "):
+            heading = line[3:].strip()
+            normalized = None
+            for std in SECTION_ORDER[1:]:
+                if std.lower().split()[0] in heading.lower():
+                    normalized = std
+                    break
+            heading_key = normalized or heading
+            sections.setdefault(heading_key, [])
+            current = heading_key
+            continue
+        sections.setdefault(current, []).append(raw_line)
+    return sections
+
+def build_docx_from_sections(
+    sections: dict,
+    placement: dict,
+    cover_img: bytes | None,
+    diag_imgs: dict,
+    selected_bps: list,
+    out: Optional[str] = None,
+    downscale: bool = True,
+):
+    """Render the DOCX into a new BytesIO, or into the file ``out`` if given.
+
+    Images are re-encoded at print resolution unless ``downscale`` is False
+    (the caller already did so).
+    """
+    # python-docx is only needed once a download is requested.
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+
+    def add_img(img_bytes: bytes):
+        if downscale:
+            img_bytes = prepare_image(img_bytes)
+        doc.add_picture(BytesIO(img_bytes), width=Inches(IMAGE_WIDTH_IN))
+        doc.add_paragraph()
+
+    title_text = "Case Study"
+    if sections.get("Title"):
+        t = sections["Title"][0].strip("# ").strip()
+        if t:
+            title_text = t
+    doc.add_heading(title_text, level=1)
+
+    if cover_img and placement.get("__COVER__") == "Title":
+        add_img(cover_img)
+
+    rendered = set(["Title"])
+    ordered_keys = [k for k in SECTION_ORDER if k != "Title"] + [
+        k for k in sections.keys() if k not in SECTION_ORDER
+    ]
+
+    for key in ordered_keys:
+        if key in rendered:
+            continue
+        if "visual" in key.lower() or "diagram" in key.lower():
+            continue
+        rendered.add(key)
+        doc.add_heading(key, level=2)
+        body_lines = sections.get(key, [])
+        for raw in body_lines:
+            line = raw.rstrip()
+            if not line:
+                doc.add_paragraph()
+            elif line.startswith("- ") or line.startswith("* "):
+                doc.add_paragraph(line[2:], style="List Bullet")
+            else:
+                doc.add_paragraph(line)
+        if cover_img and placement.get("__COVER__") == key and key != "Title":
+            add_img(cover_img)
+        for prompt, img in (diag_imgs or {}).items():
+            if placement.get(prompt) == key:
+                add_img(img)
+
+    if selected_bps:
+        doc.add_page_break()
+        doc.add_heading("Mapped Capability & Best Practice Statements", level=2)
+        for bp in selected_bps:
+            line = f"{bp['cap_id']} {bp['capability']} – {bp['metric_id']}: {bp['statement']}"
+            doc.add_paragraph(line, style="List Bullet")
+
+    if out is not None:
+        doc.save(out)
+        return out
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
+
+def export_key(
+    sections: dict,
+    placement: dict,
+    cover_handle: Optional[str],
+    diagram_handles: Dict[str, str],
+    selected_bps: List[Dict],
+) -> str:
+    return text_hash(
+        json.dumps(
+            {
+                "sections": sections,
+                "placement": placement,
+                "cover": cover_handle,
+                "diagrams": diagram_handles,
+                "bps": selected_bps,
+                "dpi": EXPORT_DPI,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+    )
+
+def export_docx(
+    sections: dict,
+    placement: dict,
+    cover_handle: Optional[str],
+    diagram_handles: Dict[str, str],
+    selected_bps: List[Dict],
+) -> str:
+    """Build the case study DOCX into the blob store and return its handle.
+
+    Memoized on sections, placement, image handles and best practices, so an
+    unchanged export is served from disk. Images come from the store's cached
+    print-resolution variants; evicted images are left out.
+    """
+    store = get_blob_store()
+    key = export_key(sections, placement, cover_handle, diagram_handles, selected_bps)
+    with span("export.docx") as m:
+        handle = _EXPORTS.get(key)
+        if handle and store.exists(handle):
+            m["cache_hits"] = 1
+            return handle
+        m["cache_misses"] = 1
+        px = print_px()
+        cover = store.thumbnail(cover_handle, px) if cover_handle else None
+        diagrams = {}
+        for prompt, h in diagram_handles.items():
+            data = store.thumbnail(h, px)
+            if data:
+                diagrams[prompt] = data
+        # Saved straight to a file next to the store, then moved into it.
+        os.makedirs(store.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".docx.tmp", dir=store.root)
+        os.close(fd)
+        try:
+            build_docx_from_sections(
+                sections=sections,
+                placement=placement,
+                cover_img=cover,
+                diag_imgs=diagrams,
+                selected_bps=selected_bps,
+                out=tmp,
+                downscale=False,
+            )
+            handle = store.put_file(tmp)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        path = store.path(handle)
+        if path:
+            m["bytes"] = os.path.getsize(path)
+        _EXPORTS.put(key, handle)
+        return handle
@@ -0,0 +1,126 @@
+import math
+import pickle
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Keep dotted metric IDs ("1.1.3"), vote numbers and hyphenated acronyms as
+# single tokens; their parts are indexed too so partial matches still score.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Query terms in more than this share of chunks are dropped when the query
+# also has rarer terms: they add little to BM25 but dominate scoring time.
+MAX_DF_RATIO = 0.5
+LEXICAL_FORMAT = 2
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in re.split(r"[./-]", tok) if p)
+    return out
+
+class LexicalIndex:
+    """Immutable BM25 inverted index over one segment's chunks.
+
+    Document numbers are the chunk positions in the segment, so they line up
+    with the FAISS row numbers of the same segment. Postings are held CSR
+    style in numpy arrays: term ``i`` owns ``docs[offsets[i]:offsets[i+1]]``
+    and the matching ``tfs``, so document frequency is a subtraction and
+    scoring a term is one vectorised slice.
+    """
+
+    def __init__(self, terms: List[str], offsets: "np.ndarray", docs: "np.ndarray", tfs: "np.ndarray", doc_len: "np.ndarray"):
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.n_docs = len(doc_len)
+        self.total_len = int(doc_len.sum())
+
+    @classmethod
+    def build(cls, texts: Sequence[str]) -> "LexicalIndex":
+        import numpy as np
+
+        lists: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_len: List[int] = []
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                entry = lists.get(term)
+                if entry is None:
+                    entry = lists[term] = ([], [])
+                entry[0].append(doc)
+                entry[1].append(tf)
+        terms = list(lists)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(lists[t][0]) for t in terms], out=offsets[1:])
+        total = int(offsets[-1])
+        docs = np.fromiter((d for t in terms for d in lists[t][0]), dtype=np.int32, count=total)
+        tfs = np.fromiter((f for t in terms for f in lists[t][1]), dtype=np.float32, count=total)
+        return cls(terms, offsets, docs, tfs, np.asarray(doc_len, dtype=np.float32))
+
+    def doc_freq(self, term: str) -> int:
+        i = self.vocab.get(term)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def top(self, terms: Sequence[str], idf: Dict[str, float], avgdl: float, k: int) -> List[Tuple[int, float]]:
+        """The ``k`` best ``(doc, BM25 score)`` pairs for ``terms``, best first."""
+        import numpy as np
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in terms:
+            i = self.vocab.get(term)
+            if i is None:
+                continue
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            docs, tf = self.docs[lo:hi], self.tfs[lo:hi]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docs] / avgdl)
+            # Each document appears once per term, so fancy-index += is safe.
+            scores[docs] += idf.get(term, 0.0) * tf * (BM25_K1 + 1) / (tf + norm)
+        hit = np.flatnonzero(scores)
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k)[:k]]
+        hit = hit[np.lexsort((hit, -scores[hit]))]
+        return [(int(p), float(scores[p])) for p in hit]
+
+    def save(self, path: str):
+        data = {
+            "version": LEXICAL_FORMAT,
+            "terms": self.terms,
+            "offsets": self.offsets,
+            "docs": self.docs,
+            "tfs": self.tfs,
+            "doc_len": self.doc_len,
+        }
+        with open(path, "wb") as fh:
+            pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path, "rb") as fh:
+            data = pickle.load(fh)
+        if data.get("version") != LEXICAL_FORMAT:
+            # Older varint postings: the caller rebuilds from the segment text.
+            raise ValueError(f"unsupported lexical index format in {path}")
+        return cls(data["terms"], data["offsets"], data["docs"], data["tfs"], data["doc_len"])
+
+def bm25_idf(df: int, n_docs: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of several ranked key lists."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -1,38 +1,156 @@
-import os
-from typing import List, Union
-import streamlit as st
-from openai import OpenAI, OpenAIError
-try:
-    from openai import APIStatusError
-except Exception:
-    APIStatusError = Exception
-
-_API_KEY = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-if not _API_KEY:
-    raise RuntimeError("OPENAI_API_KEY is missing. Add it in Streamlit Secrets or environment variables.")
-
-CHAT_MODEL = st.secrets.get("CHAT_MODEL", "gpt-4o-mini")
-EMBED_MODEL = st.secrets.get("EMBEDDING_MODEL", "text-embedding-3-small")
-IMAGE_MODEL = st.secrets.get("IMAGE_MODEL", "gpt-image-1")
-
-client = OpenAI(api_key=_API_KEY)
-
-def chat(messages, model: str = CHAT_MODEL) -> str:
-    try:
-        resp = client.chat.completions.create(model=model, messages=messages)
-        return resp.choices[0].message.content
-    except APIStatusError as e:
-        status = getattr(e, "status_code", "unknown")
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from core.cache import get_response_cache
+from core.metrics import bind_session, span
+from core.providers import get_provider, setting
+
+CHAT_MODEL = setting("CHAT_MODEL", "gpt-4o-mini")
+EMBED_MODEL = setting("EMBEDDING_MODEL", "text-embedding-3-small")
+IMAGE_MODEL = setting("IMAGE_MODEL", "gpt-image-1")
+IMAGE_CONCURRENCY = int(setting("IMAGE_CONCURRENCY", "4"))
+# Optional process-wide cap on in-flight model API calls (chat, images,
+# embeddings). 0 means unlimited, the default for the interactive app; the
+# batch pipeline sets one with set_api_concurrency().
+API_CONCURRENCY = int(setting("API_CONCURRENCY", "0"))
+
+_API_SLOTS: Optional[threading.BoundedSemaphore] = None
+
+def set_api_concurrency(limit: int):
+    """Cap in-flight API calls at ``limit`` for this process; 0 removes the cap."""
+    global _API_SLOTS
+    _API_SLOTS = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+set_api_concurrency(API_CONCURRENCY)
+
+@contextmanager
+def api_slot():
+    """Hold an API slot for the duration of a call, if a limit is set."""
+    slots = _API_SLOTS
+    if slots is None:
+        yield
+        return
+    with slots:
+        yield
+
+def _is_api_error(e: Exception) -> bool:
+    # Checked by module so the openai package is not imported up front.
+    return type(e).__module__.split(".")[0] == "openai"
+
+def _chat_error(e: Exception) -> RuntimeError:
+    status = getattr(e, "status_code", None)
+    if status is not None:
         body = getattr(getattr(e, "response", None), "text", "") or str(e)
-        raise RuntimeError(f"Chat API error [{status}]: {body[:400]}")
-    except OpenAIError as e:
-        raise RuntimeError(f"Chat API error: {getattr(e, 'message', str(e))}")
+        return RuntimeError(f"Chat API error [{status}]: {body[:400]}")
+    return RuntimeError(f"Chat API error: {getattr(e, 'message', str(e))}")
+
+def _chat_cache_key(messages, model: str, params: Dict) -> str:
+    # The provider is part of the key: replies from the offline "local"
+    # backend must never be served to a real model run.
+    return get_response_cache().make_key(
+        provider=get_provider().name, model=model, messages=messages, params=params
+    )
+
+def chat(
+    messages,
+    model: str = CHAT_MODEL,
+    cache: Union[bool, str] = False,
+    ttl: Optional[float] = None,
+    **params,
+) -> str:
+    """Run a chat completion; extra ``params`` are passed to the API.
+
+    ``cache=True`` serves identical (model, messages, params) calls from the
+    disk cache; ``cache="refresh"`` skips the lookup but stores the new reply.
+    ``ttl`` overrides the cache's default max age in seconds for the lookup.
+    """
+    provider = get_provider()
+    with span("llm.chat", model=model, provider=provider.name) as m:
+        key = _chat_cache_key(messages, model, params) if cache else None
+        if cache is True:
+            hit = get_response_cache().get(key, ttl=ttl)
+            if hit is not None:
+                m["cache_hits"] = 1
+                return hit
+            m["cache_misses"] = 1
+        try:
+            with api_slot():
+                content, used = provider.chat(messages, model, **params)
+        except Exception as e:
+            if _is_api_error(e):
+                raise _chat_error(e)
+            raise
+        if used:
+            m["tokens_in"] = used["prompt_tokens"]
+            m["tokens_out"] = used["completion_tokens"]
+        if key is not None and content is not None:
+            get_response_cache().put(key, content)
+        return content
+
+def invalidate_chat_cache(messages, model: str = CHAT_MODEL, **params):
+    get_response_cache().delete(_chat_cache_key(messages, model, params))
+
+def clear_chat_cache():
+    get_response_cache().clear()
+
+def chat_stream(messages, model: str = CHAT_MODEL, usage: Optional[Dict] = None) -> Iterator[str]:
+    """Yield the completion text as it arrives (e.g. for ``st.write_stream``).
+
+    If ``usage`` is given it is filled with the token counts once the stream ends.
+    """
+    provider = get_provider()
+    with span("llm.chat_stream", model=model, provider=provider.name) as m:
+        try:
+            stream = provider.chat_stream(messages, model)
+            # The slot covers opening the request only: it is never held
+            # across a yield, where an abandoned reader would keep it.
+            with api_slot():
+                first = next(stream, (None, None))
+            for delta, used in chain([first], stream):
+                if delta:
+                    yield delta
+                if used:
+                    m["tokens_in"] = used["prompt_tokens"]
+                    m["tokens_out"] = used["completion_tokens"]
+                    if usage is not None:
+                        usage.update(used)
+        except Exception as e:
+            if _is_api_error(e):
+                raise _chat_error(e)
+            raise
 
 def generate_image(prompt: str, size: str = "1024x1024") -> bytes:
-    try:
-        resp = client.images.generate(model=IMAGE_MODEL, prompt=prompt, size=size)
-        b64 = resp.data[0].b64_json
-        import base64 as _b64
-        return _b64.b64decode(b64)
-    except Exception as e:
-        raise RuntimeError(f"Image generation error: {e}")
+    provider = get_provider()
+    with span("llm.image", model=IMAGE_MODEL, size=size, provider=provider.name) as m:
+        try:
+            with api_slot():
+                png = provider.image(prompt, IMAGE_MODEL, size)
+        except Exception as e:
+            raise RuntimeError(f"Image generation error: {e}")
+        m["bytes"] = len(png)
+        return png
+
+def generate_images(
+    prompts: List[str],
+    size: str = "1024x1024",
+    max_workers: int = IMAGE_CONCURRENCY,
+) -> Iterator[Tuple[int, Optional[bytes], Optional[str]]]:
+    """Generate several images concurrently.
+
+    Yields ``(index, png_bytes, error)`` in completion order, where ``index`` is
+    the position in ``prompts``. A failed image yields ``(index, None, message)``
+    and does not affect the others.
+    """
+    if not prompts:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts)))) as pool:
+        generate = bind_session(generate_image)
+        futures = {pool.submit(generate, p, size): i for i, p in enumerate(prompts)}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result(), None
+            except Exception as e:
+                yield futures[fut], None, str(e)
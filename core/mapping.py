@@ -0,0 +1,127 @@
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from core.cache import CACHE_DIR, text_hash
+from core.metrics import span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Statements sent to the LLM for confirmation; the rest are ranked out locally.
+SHORTLIST_SIZE = int(os.getenv("MAPPING_SHORTLIST", "20"))
+CASE_CHUNK_CHARS = 800
+MAX_CASE_CHUNKS = 40
+
+def statement_text(bp: Dict) -> str:
+    return f"{bp['capability']}: {bp['statement']}"
+
+class StatementIndex:
+    """Unit-normalised embeddings of best-practice statements, one row per metric ID."""
+
+    def __init__(self, key: str, ids: List[str], vectors: "np.ndarray"):
+        self.key = key
+        self.ids = ids
+        self.vectors = vectors
+
+    @staticmethod
+    def path_for(key: str) -> str:
+        return os.path.join(CACHE_DIR, f"best_practices-{key[:16]}.npz")
+
+    @classmethod
+    def build(cls, key: str, bps: Sequence[Dict], vectors: Sequence[Sequence[float]]) -> "StatementIndex":
+        import numpy as np
+
+        return cls(key, [bp["metric_id"] for bp in bps], _normalise(np.asarray(vectors, dtype=np.float32)))
+
+    def save(self):
+        import numpy as np
+
+        path = self.path_for(self.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, ids=np.asarray(self.ids), vectors=self.vectors)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, key: str) -> Optional["StatementIndex"]:
+        import numpy as np
+
+        path = cls.path_for(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(key, [str(i) for i in data["ids"]], data["vectors"])
+
+def _normalise(vectors: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+_INDEX: Optional[StatementIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+def _index_key(model: str, bps: Sequence[Dict]) -> str:
+    return text_hash(model + "\n" + "\n".join(f"{bp['metric_id']}\t{statement_text(bp)}" for bp in bps))
+
+def get_statement_index(bps: Sequence[Dict]) -> StatementIndex:
+    """The index for exactly these statements under the current embedding model.
+
+    Built once and persisted under data/cache; a changed framework or
+    embedding model gets a new key and is rebuilt.
+    """
+    global _INDEX
+    from core.rag import embed_texts, embedding_model
+
+    key = _index_key(embedding_model(), bps)
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.key != key:
+            index = StatementIndex.load(key)
+            if index is None:
+                with span("mapping.build_index", statements=len(bps)):
+                    vectors = embed_texts([statement_text(bp) for bp in bps])
+                index = StatementIndex.build(key, bps, vectors)
+                index.save()
+            _INDEX = index
+        return _INDEX
+
+def _case_chunks(case_md: str) -> List[str]:
+    # Paragraphs packed to about CASE_CHUNK_CHARS, so each chunk is on one topic.
+    chunks: List[str] = []
+    buf = ""
+    for para in re.split(r"\n\s*\n", case_md):
+        para = para.strip()
+        if not para:
+            continue
+        if buf and len(buf) + len(para) > CASE_CHUNK_CHARS:
+            chunks.append(buf)
+            buf = ""
+        buf = f"{buf}\n\n{para}" if buf else para
+    if buf:
+        chunks.append(buf)
+    return [c[: CASE_CHUNK_CHARS * 2] for c in chunks[:MAX_CASE_CHUNKS]]
+
+def shortlist(case_md: str, bps: Sequence[Dict], n: int = SHORTLIST_SIZE) -> List[Tuple[Dict, Optional[float]]]:
+    """The ``n`` statements closest to any part of the case study, best first.
+
+    Each statement scores its highest cosine similarity to a case chunk. When
+    the framework has no more than ``n`` statements they are all returned
+    unscored and nothing is embedded.
+    """
+    if len(bps) <= n:
+        return [(bp, None) for bp in bps]
+    import numpy as np
+
+    from core.rag import embed_texts
+
+    with span("mapping.shortlist") as m:
+        index = get_statement_index(bps)
+        chunks = _case_chunks(case_md) or [case_md[:CASE_CHUNK_CHARS]]
+        queries = _normalise(np.asarray(embed_texts(chunks), dtype=np.float32))
+        scores = (index.vectors @ queries.T).max(axis=1)
+        order = np.argsort(-scores)[:n]
+        by_id = {bp["metric_id"]: bp for bp in bps}
+        m["candidates"] = len(bps)
+        return [(by_id[index.ids[i]], float(scores[i])) for i in order]
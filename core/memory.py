@@ -0,0 +1,146 @@
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.lexical import tokenize
+
+RECENT_TOKENS = 1500
+SUMMARY_TOKENS = 400
+# Evicted turns are summarised in one call once this many tokens have piled up.
+SUMMARY_BATCH_TOKENS = 600
+MAX_DISPLAY_MESSAGES = 100
+QUESTION_TOKENS = 800
+
+# Questions opening with these, or short ones using a pronoun, usually refer
+# back to the previous answer rather than asking for new material.
+_FOLLOW_UP_OPENERS = {"and", "also", "but", "so", "then", "elaborate", "explain", "expand"}
+_PRONOUNS = {"it", "its", "that", "this", "those", "these", "they", "them", "their", "he", "she"}
+_FOLLOW_UP_MAX_WORDS = 8
+
+def _count(text: str, model: str) -> int:
+    from core.rag import count_tokens
+
+    return count_tokens(text, model)
+
+def _summarize(summary: str, turns: List[Tuple[str, str]], model: str, max_tokens: int) -> str:
+    from core.llm import chat
+
+    transcript = "\n".join(f"{role.upper()}: {content}" for role, content in turns)
+    prompt = f"""Update the running summary of a conversation about a public-sector finance case study.
+Keep facts, figures, names and open questions; drop pleasantries. At most {max_tokens} tokens.
+
+CURRENT SUMMARY:
+{summary or "(none)"}
+
+NEW TURNS:
+{transcript}
+
+Return only the updated summary."""
+    return chat([{"role": "user", "content": prompt}], model=model, cache=True, max_tokens=max_tokens) or summary
+
+class ConversationMemory:
+    """Bounded chat memory: recent turns verbatim plus a rolling summary of older ones.
+
+    Prompts built by ``messages()`` stay within roughly
+    ``summary_tokens + recent_tokens`` of history however long the session
+    runs. ``display`` keeps the last MAX_DISPLAY_MESSAGES for rendering.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        recent_tokens: int = RECENT_TOKENS,
+        summary_tokens: int = SUMMARY_TOKENS,
+        summarize: Callable[[str, List[Tuple[str, str]], str, int], str] = _summarize,
+    ):
+        self.model = model
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.summary = ""
+        self.recent: List[Tuple[str, str, int]] = []
+        self.evicted: List[Tuple[str, str]] = []
+        self.evicted_tokens = 0
+        self.display: List[Tuple[str, str]] = []
+        # Last retrieved context, reused by follow-up questions.
+        self.context: Optional[str] = None
+        self.context_key: Optional[str] = None
+
+    def add(self, role: str, content: str):
+        self.display.append((role, content))
+        del self.display[:-MAX_DISPLAY_MESSAGES]
+        tokens = _count(content, self.model)
+        if tokens > self.recent_tokens // 2:
+            # One long answer must not push every other turn out of the window.
+            from core.rag import truncate_tokens
+
+            content = truncate_tokens(content, self.recent_tokens // 2, self.model)
+            tokens = self.recent_tokens // 2
+        self.recent.append((role, content, tokens))
+        while len(self.recent) > 1 and sum(t for _, _, t in self.recent) > self.recent_tokens:
+            role_, content_, tokens = self.recent.pop(0)
+            self.evicted.append((role_, content_))
+            self.evicted_tokens += tokens
+        if self.evicted_tokens >= SUMMARY_BATCH_TOKENS:
+            self.fold()
+
+    def fold(self):
+        """Merge evicted turns into the rolling summary."""
+        if not self.evicted:
+            return
+        self.summary = self.summarize(self.summary, self.evicted, self.model, self.summary_tokens)
+        self.evicted = []
+        self.evicted_tokens = 0
+
+    def messages(self, system: str) -> List[Dict[str, str]]:
+        """System prompt, summary and recent turns; append the new user message to this."""
+        out = [{"role": "system", "content": system}]
+        if self.summary or self.evicted:
+            # Turns evicted since the last fold are not lost: they ride along
+            # (trimmed) until the next summary call absorbs them.
+            pending = " ".join(c for _, c in self.evicted)[: SUMMARY_BATCH_TOKENS * 4]
+            text = "\n".join(p for p in (self.summary, pending) if p)
+            out.append({"role": "system", "content": f"Summary of the earlier conversation:\n{text}"})
+        out += [{"role": role, "content": content} for role, content, _ in self.recent]
+        return out
+
+    def clear(self):
+        self.__init__(self.model, self.recent_tokens, self.summary_tokens, self.summarize)
+
+def is_follow_up(question: str, memory: ConversationMemory) -> bool:
+    if memory.context is None or not memory.recent:
+        return False
+    words = re.findall(r"[\w']+", question.lower())
+    if not words:
+        return False
+    return words[0] in _FOLLOW_UP_OPENERS or (len(words) <= _FOLLOW_UP_MAX_WORDS and bool(_PRONOUNS & set(words)))
+
+def trim_question(question: str, model: str) -> str:
+    from core.rag import count_tokens, truncate_tokens
+
+    if count_tokens(question, model) <= QUESTION_TOKENS:
+        return question
+    return truncate_tokens(question, QUESTION_TOKENS, model)
+
+def case_context(case_md: str, question: str, max_tokens: int, model: str) -> str:
+    """The case study, or its sections most relevant to ``question`` within ``max_tokens``."""
+    from core.rag import build_context, count_tokens
+
+    if count_tokens(case_md, model) <= max_tokens:
+        return case_md
+    sections = [s.strip() for s in re.split(r"\n(?=#{1,3} )", case_md) if s.strip()]
+    docs = [Counter(tokenize(s)) for s in sections]
+    terms = set(tokenize(question))
+
+    def score(i: int) -> float:
+        # Term overlap weighted by how rare the term is across sections.
+        return sum(
+            math.log(1 + len(docs) / sum(1 for d in docs if t in d)) * math.log(1 + docs[i][t])
+            for t in terms
+            if docs[i][t]
+        )
+
+    order = sorted(range(len(sections)), key=score, reverse=True)
+    hits = [{"text": sections[i], "filename": "case_study", "page": i} for i in order]
+    return build_context(hits, max_tokens=max_tokens, model=model)
@@ -0,0 +1,173 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# Latency histogram buckets in seconds (Prometheus "le" bounds).
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_SESSIONS = 256
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+T = TypeVar("T")
+
+class _Series:
+    __slots__ = ("count", "errors", "total_s", "max_s", "buckets", "fields")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.fields: Dict[str, float] = {}
+
+    def observe(self, seconds: float, error: bool, fields: Dict[str, float]):
+        self.count += 1
+        self.errors += int(error)
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        for name, value in fields.items():
+            self.fields[name] = self.fields.get(name, 0) + value
+
+_LOCK = threading.Lock()
+_PROCESS: Dict[_Key, _Series] = {}
+_SESSIONS: "OrderedDict[str, Dict[_Key, _Series]]" = OrderedDict()
+
+# Session id bound to a worker thread by bind_session().
+_BOUND = threading.local()
+
+def _session_id() -> Optional[str]:
+    sid = getattr(_BOUND, "session_id", None)
+    if sid is not None:
+        return sid
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+    return getattr(ctx, "session_id", None)
+
+def bind_session(fn: Callable[..., T]) -> Callable[..., T]:
+    """Wrap ``fn`` so spans it records on another thread count toward the caller's session.
+
+    Streamlit only exposes the session on the script thread; call this on
+    that thread when submitting work to an executor.
+    """
+    sid = _session_id()
+    if sid is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        prev = getattr(_BOUND, "session_id", None)
+        _BOUND.session_id = sid
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _BOUND.session_id = prev
+
+    return run
+
+def _record(name: str, labels: Dict[str, str], seconds: float, error: bool, fields: Dict[str, float]):
+    key: _Key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    sid = _session_id()
+    with _LOCK:
+        _PROCESS.setdefault(key, _Series()).observe(seconds, error, fields)
+        if sid is not None:
+            per = _SESSIONS.get(sid)
+            if per is None:
+                per = _SESSIONS[sid] = {}
+                while len(_SESSIONS) > MAX_SESSIONS:
+                    _SESSIONS.popitem(last=False)
+            _SESSIONS.move_to_end(sid)
+            per.setdefault(key, _Series()).observe(seconds, error, fields)
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[Dict[str, float]]:
+    """Time a block and count it under ``name``/``labels``.
+
+    The yielded dict collects numeric fields (tokens_in, tokens_out, bytes,
+    cache_hits, ...) that are summed per series. An exception counts as an
+    error and is re-raised.
+    """
+    fields: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield fields
+    except BaseException as e:
+        # Generators closed early are not failures.
+        error = not isinstance(e, GeneratorExit)
+        raise
+    finally:
+        _record(name, labels, time.perf_counter() - t0, error, fields)
+
+def _rows(store: Dict[_Key, _Series]) -> List[Dict]:
+    rows = []
+    for (name, labels), s in sorted(store.items()):
+        row = {
+            "span": name,
+            "labels": ", ".join(f"{k}={v}" for k, v in labels),
+            "count": s.count,
+            "errors": s.errors,
+            "mean_ms": round(s.total_s / s.count * 1000, 2) if s.count else None,
+            "max_ms": round(s.max_s * 1000, 2),
+        }
+        row.update(s.fields)
+        rows.append(row)
+    return rows
+
+def snapshot(session_id: Optional[str] = None) -> List[Dict]:
+    """Rows for the whole process, or for one Streamlit session."""
+    with _LOCK:
+        if session_id is None:
+            return _rows(_PROCESS)
+        return _rows(_SESSIONS.get(session_id, {}))
+
+def current_session_id() -> Optional[str]:
+    return _session_id()
+
+def reset():
+    with _LOCK:
+        _PROCESS.clear()
+        _SESSIONS.clear()
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...], **extra) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def prometheus_text(prefix: str = "leapscribe") -> str:
+    """Process-wide series in the Prometheus text exposition format."""
+    with _LOCK:
+        items = sorted(_PROCESS.items())
+        lines = [
+            f"# HELP {prefix}_span_seconds Latency of instrumented calls.",
+            f"# TYPE {prefix}_span_seconds histogram",
+        ]
+        for (name, labels), s in items:
+            if not s.count:
+                continue
+            for bound, n in zip(BUCKETS, s.buckets):
+                lines.append(f"{prefix}_span_seconds_bucket{_fmt_labels(labels, span=name, le=bound)} {n}")
+            lines.append(f"{prefix}_span_seconds_bucket{_fmt_labels(labels, span=name, le='+Inf')} {s.count}")
+            lines.append(f"{prefix}_span_seconds_sum{_fmt_labels(labels, span=name)} {s.total_s:.6f}")
+            lines.append(f"{prefix}_span_seconds_count{_fmt_labels(labels, span=name)} {s.count}")
+        lines += [f"# TYPE {prefix}_span_errors_total counter"]
+        for (name, labels), s in items:
+            lines.append(f"{prefix}_span_errors_total{_fmt_labels(labels, span=name)} {s.errors}")
+        fields = sorted({f for _, s in items for f in s.fields})
+        for field in fields:
+            lines.append(f"# TYPE {prefix}_{field}_total counter")
+            for (name, labels), s in items:
+                if field in s.fields:
+                    lines.append(f"{prefix}_{field}_total{_fmt_labels(labels, span=name)} {s.fields[field]:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,364 @@
+"""Headless batch runs of the case study workflow (Upload → DOCX) for many cases.
+
+Run from the repository root::
+
+    python -m core.pipeline cases/ --out output/ --workers 4
+    python -m core.pipeline cases/ --out output/ --force draft
+
+``cases/`` holds one folder per case with its artefacts (PDF/DOCX/TXT/MD) and
+an ``answers.json``: either ``{"question": "answer", ...}`` or
+``{"answers": {...}, "topic_hint": "...", "cover_style": "...",
+"cover_theme": "...", "diagrams": 2}``. A case without answers stops after the
+questions stage and gets an ``answers.template.json`` to fill in.
+
+Every stage writes its own file under ``output/<case>/``; a rerun skips stages
+whose output already exists, so an interrupted or partly failed run resumes
+where it stopped. Cases run ``--workers`` at a time and all their model calls
+share one ``--api-concurrency`` limit (core.llm.set_api_concurrency).
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from core.metrics import span
+
+ARTEFACT_TYPES = (".pdf", ".docx", ".txt", ".md")
+ANSWERS_FILE = "answers.json"
+STAGES = ["ingest", "questions", "draft", "visuals", "mapping", "export"]
+OUTPUTS = {
+    "ingest": "ingest.json",
+    "questions": "questions.json",
+    "draft": "draft.md",
+    "visuals": "visuals.json",
+    "mapping": "mapping.json",
+    "export": "case_study.docx",
+}
+DEFAULT_STYLE = "flat illustration"
+DEFAULT_THEME = "public finance, collaboration, knowledge sharing, AI assistance, case studies"
+DEFAULT_TOPIC_HINT = "finance transformation, case study"
+DEFAULT_API_CONCURRENCY = 8
+
+_PRINT_LOCK = threading.Lock()
+
+class NeedsAnswers(Exception):
+    pass
+
+def _log(case: str, msg: str):
+    with _PRINT_LOCK:
+        print(f"[{time.strftime('%H:%M:%S')}] {case}: {msg}", flush=True)
+
+def _write(path: str, data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+def _write_json(path: str, obj):
+    _write(path, json.dumps(obj, indent=2, ensure_ascii=False))
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+class Case:
+    def __init__(self, src: str, out_root: str):
+        self.src = src
+        self.id = os.path.basename(os.path.normpath(src))
+        self.out = os.path.join(out_root, self.id)
+        # Readable prefix plus a hash of the exact folder name: "Case A" and
+        # "Case-A" must not share an index, and the whole name stays within
+        # the 64 characters core.rag keeps.
+        digest = hashlib.sha1(self.id.encode("utf-8")).hexdigest()[:10]
+        self.namespace = f"batch-{re.sub(r'[^A-Za-z0-9_-]+', '-', self.id)[:40]}-{digest}"
+
+    def path(self, stage: str) -> str:
+        return os.path.join(self.out, OUTPUTS[stage])
+
+    def done(self, stage: str) -> bool:
+        return os.path.exists(self.path(stage))
+
+    def files(self) -> List[str]:
+        return sorted(
+            os.path.join(self.src, n)
+            for n in os.listdir(self.src)
+            if n.lower().endswith(ARTEFACT_TYPES) and os.path.isfile(os.path.join(self.src, n))
+        )
+
+    def settings(self) -> Optional[Dict]:
+        path = os.path.join(self.src, ANSWERS_FILE)
+        if not os.path.exists(path):
+            return None
+        data = _read_json(path)
+        if not isinstance(data.get("answers"), dict):
+            data = {"answers": data}
+        data["answers"] = {str(k): str(v) for k, v in data["answers"].items()}
+        return data
+
+def stage_ingest(case: Case, opts):
+    from core import rag
+
+    files = []
+    for path in case.files():
+        with open(path, "rb") as fh:
+            files.append((fh.read(), os.path.basename(path)))
+    if not files:
+        raise RuntimeError(f"no artefacts ({', '.join(ARTEFACT_TYPES)}) in {case.src}")
+    # Start from an empty index so a rerun after a failed ingest does not duplicate chunks.
+    rag.clear_index(case.namespace)
+    extracted = []
+
+    def docs():
+        # Each file is indexed as soon as it is extracted; only its text is kept.
+        for r in rag.iter_extracted(files):
+            extracted.append({"filename": r["filename"], "text": rag.segments_to_text(r["segments"]), "error": r["error"]})
+            yield {"segments": r["segments"], "meta": {"filename": r["filename"], "source": "batch"}}
+
+    rag.upsert_documents(docs(), namespace=case.namespace)
+    _write_json(
+        case.path("ingest"),
+        {
+            "namespace": case.namespace,
+            "files": [{"filename": r["filename"], "chars": len(r["text"]), "error": r["error"]} for r in extracted],
+            "texts": [{"filename": r["filename"], "text": r["text"]} for r in extracted],
+        },
+    )
+
+def stage_questions(case: Case, opts):
+    from core.analysis import missing_info_questions
+    from core.utils import parse_questions_list
+
+    texts = _read_json(case.path("ingest"))["texts"]
+    raw, sheets, failed = missing_info_questions([(d["filename"], d["text"]) for d in texts])
+    questions = parse_questions_list(raw)
+    _write_json(
+        case.path("questions"),
+        {"raw": raw, "questions": questions, "fact_sheets": sheets, "failed_groups": failed},
+    )
+    if case.settings() is None:
+        _write_json(os.path.join(case.out, "answers.template.json"), {"answers": {q: "" for q in questions}})
+
+def stage_draft(case: Case, opts):
+    from core.drafting import draft_sections
+    from core.llm import CHAT_MODEL, chat
+    from core.prompts import draft_prompt, retrieval_query
+    from core.rag import build_context, query
+
+    settings = case.settings()
+    if settings is None:
+        raise NeedsAnswers(f"add {ANSWERS_FILE} to {case.src} (see answers.template.json)")
+    answers = settings["answers"]
+    hint = settings.get("topic_hint", DEFAULT_TOPIC_HINT)
+    if opts.parallel_draft:
+        draft = draft_sections(answers, hint, case.namespace, cache=True)
+    else:
+        hits = query(retrieval_query(answers, hint), k=16, namespace=case.namespace)
+        context_text = build_context(hits, max_tokens=3000, model=CHAT_MODEL) or "(no retrieved context)"
+        draft = chat([{"role": "user", "content": draft_prompt(context_text, answers)}], cache=True)
+    _write(case.path("draft"), draft)
+
+def stage_visuals(case: Case, opts):
+    from core.llm import chat, generate_images
+    from core.prompts import cover_image_prompt, diagram_image_prompt, diagram_suggestions_prompt, parse_suggestions
+
+    if opts.no_images:
+        _write_json(case.path("visuals"), {"cover": None, "diagrams": {}, "errors": {}})
+        return
+    settings = case.settings() or {}
+    with open(case.path("draft"), "r", encoding="utf-8") as fh:
+        draft = fh.read()
+    n = int(settings.get("diagrams", opts.diagrams))
+    out = chat([{"role": "user", "content": diagram_suggestions_prompt(draft)}], cache=True)
+    suggestions = parse_suggestions(out)[:n]
+    image_prompts = [diagram_image_prompt(s) for s in suggestions]
+    names = [f"diagram-{i}.png" for i in range(1, len(suggestions) + 1)]
+    if not opts.no_cover:
+        image_prompts.append(
+            cover_image_prompt(settings.get("cover_style", DEFAULT_STYLE), settings.get("cover_theme", DEFAULT_THEME))
+        )
+        names.append("cover.png")
+    result = {"cover": None, "diagrams": {}, "errors": {}}
+    for i, png, err in generate_images(image_prompts):
+        label = suggestions[i] if i < len(suggestions) else "cover"
+        if err:
+            result["errors"][label] = err
+            continue
+        _write(os.path.join(case.out, names[i]), png)
+        if i < len(suggestions):
+            result["diagrams"][label] = names[i]
+        else:
+            result["cover"] = names[i]
+    if image_prompts and len(result["errors"]) == len(image_prompts):
+        raise RuntimeError(f"all {len(image_prompts)} images failed: {next(iter(result['errors'].values()))}")
+    _write_json(case.path("visuals"), result)
+
+def stage_mapping(case: Case, opts):
+    from core.llm import chat
+    from core.mapping import shortlist
+    from core.prompts import mapping_prompt
+    from core.utils import get_all_best_practices, parse_bp_ids
+
+    with open(case.path("draft"), "r", encoding="utf-8") as fh:
+        draft = fh.read()
+    candidates = [bp for bp, _ in shortlist(draft, get_all_best_practices())]
+    raw = chat([{"role": "user", "content": mapping_prompt(draft, candidates)}], cache=True)
+    allowed = {bp["metric_id"] for bp in candidates}
+    _write_json(
+        case.path("mapping"),
+        {
+            "raw": raw,
+            "shortlist": sorted(allowed),
+            "metric_ids": [mid for mid in parse_bp_ids(raw) if mid in allowed],
+        },
+    )
+
+def stage_export(case: Case, opts):
+    from core.export import SECTION_ORDER, build_docx_from_sections, default_placement, parse_sections
+    from core.utils import get_all_best_practices
+
+    with open(case.path("draft"), "r", encoding="utf-8") as fh:
+        sections = parse_sections(fh.read())
+    for sec in SECTION_ORDER:
+        sections.setdefault(sec, [])
+    visuals = _read_json(case.path("visuals"))
+
+    def load(name):
+        with open(os.path.join(case.out, name), "rb") as fh:
+            return fh.read()
+
+    cover = load(visuals["cover"]) if visuals["cover"] else None
+    diagrams = {prompt: load(name) for prompt, name in visuals["diagrams"].items()}
+    bp_by_id = {bp["metric_id"]: bp for bp in get_all_best_practices()}
+    ids = _read_json(case.path("mapping"))["metric_ids"]
+    tmp = case.path("export") + ".tmp"
+    build_docx_from_sections(
+        sections=sections,
+        placement=default_placement(cover is not None, diagrams),
+        cover_img=cover,
+        diag_imgs=diagrams,
+        selected_bps=[bp_by_id[i] for i in ids if i in bp_by_id],
+        out=tmp,
+    )
+    os.replace(tmp, case.path("export"))
+
+STAGE_FUNCS = {
+    "ingest": stage_ingest,
+    "questions": stage_questions,
+    "draft": stage_draft,
+    "visuals": stage_visuals,
+    "mapping": stage_mapping,
+    "export": stage_export,
+}
+
+def run_case(case: Case, opts) -> Dict:
+    """Run the stages of one case in order, skipping those already done."""
+    from core.rag import namespace_exists
+
+    os.makedirs(case.out, exist_ok=True)
+    t0 = time.time()
+    result = {"case": case.id, "status": "done", "stages": {}, "error": None}
+    until = STAGES.index(opts.until) if opts.until else len(STAGES) - 1
+    # A draft rerun needs the index; rebuild it if it has been garbage-collected.
+    if case.done("ingest") and not case.done("draft") and not namespace_exists(case.namespace):
+        os.remove(case.path("ingest"))
+    for stage in STAGES[: until + 1]:
+        if case.done(stage):
+            result["stages"][stage] = "skipped"
+            continue
+        _log(case.id, f"{stage} ...")
+        try:
+            with span("pipeline.stage", stage=stage):
+                STAGE_FUNCS[stage](case, opts)
+        except NeedsAnswers as e:
+            result.update(status="needs_answers", error=str(e))
+            result["stages"][stage] = "waiting"
+            break
+        except Exception as e:
+            result.update(status="failed", error=f"{stage}: {e}")
+            result["stages"][stage] = "failed"
+            break
+        result["stages"][stage] = "done"
+    result["seconds"] = round(time.time() - t0, 2)
+    _write_json(os.path.join(case.out, "status.json"), result)
+    _log(case.id, result["status"] + (f" ({result['error']})" if result["error"] else ""))
+    return result
+
+def discover(cases_dir: str, out_root: str, only: Optional[List[str]] = None) -> List[Case]:
+    names = sorted(n for n in os.listdir(cases_dir) if os.path.isdir(os.path.join(cases_dir, n)))
+    if only:
+        names = [n for n in names if n in only]
+    return [Case(os.path.join(cases_dir, n), out_root) for n in names]
+
+def reset_from(case: Case, stage: str):
+    """Delete the outputs of ``stage`` and every later stage."""
+    for later in STAGES[STAGES.index(stage):]:
+        if case.done(later):
+            os.remove(case.path(later))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", help="directory with one artefact folder per case")
+    parser.add_argument("--out", default="output", help="output root; one folder per case")
+    parser.add_argument("--case", action="append", help="only run this case (repeatable)")
+    parser.add_argument("--workers", type=int, default=4, help="cases processed concurrently")
+    parser.add_argument(
+        "--api-concurrency", type=int, default=DEFAULT_API_CONCURRENCY, help="global cap on in-flight API calls"
+    )
+    parser.add_argument("--provider", help="model provider, e.g. 'local' for an offline dry run")
+    parser.add_argument("--force", choices=STAGES, help="redo this stage and all later ones")
+    parser.add_argument("--until", choices=STAGES, help="stop after this stage")
+    parser.add_argument("--diagrams", type=int, default=2, help="diagrams per case")
+    parser.add_argument("--parallel-draft", action="store_true", help="draft sections concurrently")
+    parser.add_argument("--no-cover", action="store_true", help="skip the cover image")
+    parser.add_argument("--no-images", action="store_true", help="skip image generation entirely")
+    opts = parser.parse_args(argv)
+
+    # Read by core.providers when it is first imported.
+    if opts.provider:
+        os.environ["LLM_PROVIDER"] = opts.provider
+    from core.llm import set_api_concurrency
+
+    set_api_concurrency(opts.api_concurrency)
+
+    cases = discover(opts.cases, opts.out, opts.case)
+    if not cases:
+        parser.error(f"no case folders found in {opts.cases}")
+    # Cases run concurrently and ingest clears its index first, so two cases
+    # on one namespace would wipe or read each other's documents.
+    seen: Dict[str, str] = {}
+    for case in cases:
+        if case.namespace in seen:
+            parser.error(f"cases {seen[case.namespace]!r} and {case.id!r} resolve to the same index namespace")
+        seen[case.namespace] = case.id
+    if opts.force:
+        for case in cases:
+            reset_from(case, opts.force)
+
+    t0 = time.time()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, opts.workers)) as pool:
+        futures = [pool.submit(run_case, case, opts) for case in cases]
+        for fut in as_completed(futures):
+            results.append(fut.result())
+    results.sort(key=lambda r: r["case"])
+
+    os.makedirs(opts.out, exist_ok=True)
+    _write_json(
+        os.path.join(opts.out, "run.json"),
+        {"finished": time.strftime("%Y-%m-%dT%H:%M:%S"), "seconds": round(time.time() - t0, 2), "cases": results},
+    )
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    print(f"{len(results)} cases in {time.time() - t0:.1f}s: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())))
+    return 1 if counts.get("failed") else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+from typing import Dict, List
+
+def missing_info_prompt(sample: str, label: str = "Content sample") -> str:
+    return f"""You are assisting to prepare a public-sector finance CASE STUDY.
+
+Based on the following uploaded content (may be partial), list the
+MISSING INFORMATION we must ask the user as bullet questions.
+
+Cover:
+- title direction
+- executive summary angle
+- problem clarity
+- implementation specifics (timeline, roles, tools)
+- benefits with metrics
+- key learning points
+- POC contact details
+
+{label}:
+---
+{sample}
+---
+
+Return only bullet questions (can be 0, max 3).
+"""
+
+def fact_sheet_prompt(text: str, sources: str, max_words: int) -> str:
+    return f"""You are helping prepare a public-sector finance CASE STUDY from uploaded material.
+
+Write a compact FACT SHEET of what the excerpt below says about:
+- the project and its title
+- the problem or need
+- implementation (timeline, roles, tools, governance)
+- benefits and metrics
+- learning points
+- contact persons
+
+Bullet points only, at most {max_words} words. Write "not stated" for topics the excerpt does not cover.
+
+Source: {sources}
+---
+{text}
+---
+"""
+
+def answers_text(answers: Dict[str, str]) -> str:
+    return "\n".join([f"{k}: {v}" for k, v in answers.items() if v.strip()])
+
+def retrieval_query(answers: Dict[str, str], topic_hint: str) -> str:
+    return (answers_text(answers) + "\n\n" + topic_hint).strip()
+
+def draft_prompt(context_text: str, answers: Dict[str, str]) -> str:
+    return f"""You are a professional case study writer for public-sector finance.
+
+Use BOTH:
+1) CONTEXT: excerpts from source materials
+2) USER ANSWERS: structured information from a form
+
+to draft a polished, visually engaging case study with the following sections:
+
+1) Captivating Title
+2) Executive Summary (3–5 sentences)
+3) Problem / Need for the project
+4) Implementation Approach (timeline, roles, tools, governance)
+5) Benefits & Impact (quantify where possible)
+6) Key Learning Points (bulleted)
+7) Point of Contact (POC: name, role, email — use placeholders if missing)
+8) Suggested Visuals/Diagrams (list 2–3 ideas)
+
+Make sure the narrative aligns closely with the CONTEXT, and only fill gaps using reasonable inference.
+
+CONTEXT (retrieved via RAG):
+-----------------------------
+{context_text}
+
+USER ANSWERS:
+-------------
+{answers_text(answers)}
+
+Return **Markdown only**.
+"""
+
+def cover_image_prompt(style: str, theme: str) -> str:
+    return f"A {style} depicting {theme}. Clean, professional, government context, minimal color palette."
+
+def diagram_suggestions_prompt(draft: str) -> str:
+    return f"""From the following case study markdown, list three concise prompts for diagrams/flowcharts to visualise the process and impact.
+Return bullet points only (max 3 prompts).
+---
+{draft[:5000]}
+---"""
+
+def parse_suggestions(out: str) -> List[str]:
+    return [line.strip("-• ").strip() for line in out.splitlines() if line.strip()]
+
+def diagram_image_prompt(suggestion: str) -> str:
+    return f"Professional flowchart or process diagram showing: {suggestion}. Minimal style."
+
+def mapping_prompt(case_md: str, bps: List[Dict]) -> str:
+    bp_list_str = "\n".join(
+        f"{bp['metric_id']}: {bp['capability']} – {bp['statement']}"
+        for bp in bps
+    )
+    return f"""You are mapping a finance transformation case study to a capability framework.
+
+You are given:
+1) The CASE STUDY text.
+2) A list of CAPABILITY BEST PRACTICE STATEMENTS, each with a metric ID.
+
+Task:
+- Select ALL best practice statements that clearly apply to this case.
+- Return only their metric IDs as a bullet list (e.g. "- 1.1.1").
+
+CASE STUDY:
+----------------
+{case_md[:6000]}
+
+CAPABILITY BEST PRACTICE STATEMENTS:
+----------------
+{bp_list_str}
+"""
+
+# (heading, retrieval focus, writing instructions) for section-parallel drafting.
+# Headings match core.export.SECTION_ORDER so parse_sections() files them correctly.
+DRAFT_SECTIONS = [
+    ("Executive Summary", "project overview, objectives, outcomes", "3–5 sentences summarising the whole case."),
+    ("Problem / Need", "problem, pain points, background, need for the project", "Explain the problem or need for the project."),
+    (
+        "Implementation Approach",
+        "implementation timeline, roles, tools, systems, governance",
+        "Describe the timeline, roles, tools and governance.",
+    ),
+    ("Benefits & Impact", "benefits, impact, savings, results, metrics", "Quantify benefits where possible."),
+    ("Key Learning Points", "lessons learnt, challenges, what worked, recommendations", "A bulleted list of learning points."),
+    (
+        "Point of Contact",
+        "contact person, name, role, email, department",
+        "POC: name, role, email — use placeholders if missing.",
+    ),
+    ("Suggested Visuals/Diagrams", "process flow, stages, before and after", "List 2–3 ideas for visuals or diagrams."),
+]
+
+def section_prompt(heading: str, instructions: str, context_text: str, answers: Dict[str, str]) -> str:
+    return f"""You are a professional case study writer for public-sector finance.
+
+Write ONLY the "{heading}" section of a polished, visually engaging case study.
+{instructions}
+
+Use BOTH the CONTEXT (excerpts from source materials) and the USER ANSWERS.
+Make sure the narrative aligns closely with the CONTEXT, and only fill gaps using reasonable inference.
+
+CONTEXT (retrieved via RAG):
+-----------------------------
+{context_text}
+
+USER ANSWERS:
+-------------
+{answers_text(answers)}
+
+Return the section body as **Markdown only**, without the section heading.
+"""
+
+def title_prompt(context_text: str, answers: Dict[str, str]) -> str:
+    return f"""Suggest one captivating title for a public-sector finance case study based on the material below.
+
+CONTEXT:
+--------
+{context_text}
+
+USER ANSWERS:
+-------------
+{answers_text(answers)}
+
+Return only the title text, on one line.
+"""
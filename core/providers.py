@@ -0,0 +1,233 @@
+import base64
+import hashlib
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    from core.local_embeddings import LocalEmbeddings
+
+def setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Environment variable first, then Streamlit secrets, then ``default``."""
+    value = os.getenv(name)
+    if value:
+        return value
+    try:
+        import streamlit as st
+
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+Usage = Dict[str, int]
+
+class Provider(ABC):
+    """Backend for chat, embeddings and images used by core.llm and core.rag."""
+
+    name = "base"
+
+    @abstractmethod
+    def chat(self, messages, model: str, **params) -> Tuple[str, Optional[Usage]]:
+        ...
+
+    @abstractmethod
+    def chat_stream(self, messages, model: str) -> Iterator[Tuple[Optional[str], Optional[Usage]]]:
+        """Yield ``(text_delta, None)`` pairs, then ``(None, usage)`` if known."""
+
+    @abstractmethod
+    def embeddings(self, model: str) -> "Embeddings":
+        ...
+
+    def embedding_model_id(self, model: str) -> str:
+        # Used in embedding cache keys, so vectors from different backends never mix.
+        return model
+
+    @abstractmethod
+    def image(self, prompt: str, model: str, size: str) -> bytes:
+        ...
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                api_key = setting("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError(
+                        "OPENAI_API_KEY is missing. Add it in Streamlit Secrets or environment variables."
+                    )
+                self._client = OpenAI(api_key=api_key)
+            return self._client
+
+    def chat(self, messages, model: str, **params) -> Tuple[str, Optional[Usage]]:
+        resp = self.client.chat.completions.create(model=model, messages=messages, **params)
+        usage = None
+        if getattr(resp, "usage", None):
+            usage = {
+                "prompt_tokens": resp.usage.prompt_tokens,
+                "completion_tokens": resp.usage.completion_tokens,
+                "total_tokens": resp.usage.total_tokens,
+            }
+        return resp.choices[0].message.content, usage
+
+    def chat_stream(self, messages, model: str) -> Iterator[Tuple[Optional[str], Optional[Usage]]]:
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for event in stream:
+            if event.choices:
+                delta = event.choices[0].delta.content
+                if delta:
+                    yield delta, None
+            if getattr(event, "usage", None):
+                yield None, {
+                    "prompt_tokens": event.usage.prompt_tokens,
+                    "completion_tokens": event.usage.completion_tokens,
+                    "total_tokens": event.usage.total_tokens,
+                }
+
+    def embeddings(self, model: str) -> "Embeddings":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model=model, api_key=setting("OPENAI_API_KEY"))
+
+    def image(self, prompt: str, model: str, size: str) -> bytes:
+        resp = self.client.images.generate(model=model, prompt=prompt, size=size)
+        return base64.b64decode(resp.data[0].b64_json)
+
+class LocalProvider(Provider):
+    """Deterministic offline stand-in: no network, no API key, no cost.
+
+    Chat replies are templated from the prompt so every wizard step gets
+    output of the expected shape; ``LOCAL_LATENCY_MS`` adds a fixed delay per
+    call to mimic API latency under load tests.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.dim = int(setting("LOCAL_EMBED_DIM", "256"))
+        self.latency_s = float(setting("LOCAL_LATENCY_MS", "0")) / 1000
+        self._embeddings: Optional["LocalEmbeddings"] = None
+
+    def _sleep(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    @staticmethod
+    def _sentences(text: str, n: int) -> List[str]:
+        found = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if len(s.strip()) > 30]
+        return found[:n] or ["(no source material)"]
+
+    def _reply(self, messages) -> str:
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        tag = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        low = prompt.lower()
+        # The source material is the longest block between "---" rulers.
+        source = max(re.split(r"\n-{3,}\n", prompt), key=len)
+        facts = self._sentences(source, 6)
+        if "missing information" in low:
+            return "\n".join(
+                f"- What further detail can you share about: {f[:80].rstrip('.!?')}?" for f in facts[:3]
+            )
+        if "fact sheet" in low:
+            return "\n".join(f"- {f[:120]}" for f in facts[:4])
+        if "metric id" in low:
+            ids = sorted(set(re.findall(r"\b\d+\.\d+\.\d+\b", prompt)))[:3]
+            return "\n".join(f"- {i}" for i in ids)
+        if "diagram" in low and "prompts" in low:
+            return "\n".join(f"- Process flow: {f[:70]}" for f in facts[:3])
+        if "only the title" in low:
+            return f"Local Case Study {tag}"
+        if "write only the" in low:
+            return f"{facts[0]}\n\n- {facts[-1][:80]}"
+        if "case study" in low and "section" in low:
+            body = " ".join(facts)
+            return (
+                f"# Local Draft Case Study {tag}\n\n"
+                f"## Executive Summary\n{body}\n\n"
+                f"## Problem / Need\n{facts[0]}\n\n"
+                f"## Implementation Approach\n- {facts[-1]}\n\n"
+                f"## Benefits & Impact\n- Placeholder benefit ({tag}).\n\n"
+                f"## Key Learning Points\n- {facts[0][:80]}\n\n"
+                f"## Point of Contact\nName, Role, email@example.gov.sg\n"
+            )
+        return f"(local reply {tag}) " + " ".join(facts[:3])
+
+    def chat(self, messages, model: str, **params) -> Tuple[str, Optional[Usage]]:
+        self._sleep()
+        text = self._reply(messages)
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in messages)
+        completion_tokens = len(text) // 4
+        return text, {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def chat_stream(self, messages, model: str) -> Iterator[Tuple[Optional[str], Optional[Usage]]]:
+        text, usage = self.chat(messages, model)
+        for word in re.findall(r"\S+\s*", text):
+            yield word, None
+        yield None, usage
+
+    def embeddings(self, model: str) -> "Embeddings":
+        if self._embeddings is None:
+            from core.local_embeddings import LocalEmbeddings
+
+            self._embeddings = LocalEmbeddings(self.dim, self.latency_s)
+        return self._embeddings
+
+    def embedding_model_id(self, model: str) -> str:
+        return f"local-hash-{self.dim}"
+
+    def image(self, prompt: str, model: str, size: str) -> bytes:
+        from PIL import Image, ImageDraw
+
+        self._sleep()
+        w, h = (int(x) for x in size.lower().split("x"))
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        img = Image.new("RGB", (w, h), tuple(128 + b // 2 for b in digest[:3]))
+        draw = ImageDraw.Draw(img)
+        words, line, y = prompt.split(), "", 20
+        for word in words + [""]:
+            if word and len(line) + len(word) < 60:
+                line = f"{line} {word}".strip()
+                continue
+            draw.text((20, y), line, fill=(20, 20, 20))
+            y += 16
+            line = word
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+
+PROVIDERS = {"openai": OpenAIProvider, "local": LocalProvider}
+_PROVIDER: Optional[Provider] = None
+_PROVIDER_LOCK = threading.Lock()
+
+def get_provider() -> Provider:
+    """The backend named by ``LLM_PROVIDER`` ("openai" by default, or "local")."""
+    global _PROVIDER
+    with _PROVIDER_LOCK:
+        if _PROVIDER is None:
+            name = (setting("LLM_PROVIDER", "openai") or "openai").lower()
+            if name not in PROVIDERS:
+                raise RuntimeError(f"Unknown LLM_PROVIDER '{name}'. Choose one of: {', '.join(PROVIDERS)}.")
+            _PROVIDER = PROVIDERS[name]()
+        return _PROVIDER
@@ -1,44 +1,149 @@
 import os
-from typing import List, Dict
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 from io import BytesIO
 
-from PyPDF2 import PdfReader
-from docx import Document
+from core.cache import LRUCache, get_embedding_cache, text_hash
+from core.lexical import tokenize
+from core.metrics import bind_session, span
+from core.providers import get_provider, setting
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+# PDF/Word parsers, LangChain, FAISS and tiktoken are imported where they are
+# first used: pages import this module just to render, and the spawned
+# extraction workers re-import it on start.
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    import numpy as np
+    import tiktoken
+    from PyPDF2 import PdfReader
+    from langchain_core.embeddings import Embeddings
+    from core.segments import SegmentedIndex
 
 VECTORSTORE_DIR = "data/faiss_langchain"
+NAMESPACES_DIR = "data/namespaces"
+NAMESPACE_IDLE_SECONDS = int(os.getenv("NAMESPACE_IDLE_SECONDS", "1800"))
+NAMESPACE_TTL_DAYS = float(os.getenv("NAMESPACE_TTL_DAYS", "14"))
+# Dense search misses exact tokens such as metric IDs ("1.1.3") and vote
+# numbers, so by default it is fused with BM25 over the same chunks.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# In-memory index handles shared by every Streamlit session in this process,
+# one per namespace directory. Each handle re-reads its segment manifest only
+# when it changes on disk, so writes from other processes are still picked
+# up, and is dropped after NAMESPACE_IDLE_SECONDS without use.
+_VS_LOCK = threading.RLock()
+_VS_CACHE: Dict[str, Dict] = {}
+_EMBEDDINGS: Dict[str, "Embeddings"] = {}
+
+# Repeat retrievals skip the network: query vectors are cached per model and
+# results per (index dir, index version, query, k, mode). A new manifest
+# version after any upsert or compaction makes old result keys unreachable.
+_QUERY_VECTORS = LRUCache(int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "2048")))
+_QUERY_RESULTS = LRUCache(int(os.getenv("QUERY_RESULT_CACHE_SIZE", "512")))
+
+def _namespace_dir(namespace: Optional[str]) -> str:
+    # ``None`` is the shared knowledge base that predates namespaces.
+    if not namespace:
+        return VECTORSTORE_DIR
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in namespace)[:64]
+    return os.path.join(NAMESPACES_DIR, safe)
+
+def _evict_idle(now: float):
+    for path, entry in list(_VS_CACHE.items()):
+        if now - entry["last_used"] > NAMESPACE_IDLE_SECONDS:
+            del _VS_CACHE[path]
 
-def _get_embeddings() -> OpenAIEmbeddings:
-    model = (
-        os.getenv("EMBEDDING_MODEL")
-        or os.getenv("OPENAI_EMBEDDING_MODEL")
+def _entry(namespace: Optional[str]) -> Dict:
+    path = _namespace_dir(namespace)
+    now = time.time()
+    with _VS_LOCK:
+        _evict_idle(now)
+        entry = _VS_CACHE.get(path)
+        if entry is None:
+            from core.segments import SegmentedIndex
+
+            entry = _VS_CACHE[path] = {
+                "path": path,
+                "index": SegmentedIndex(path, _get_embeddings),
+                "last_used": now,
+                "touched": 0.0,
+            }
+        entry["last_used"] = now
+        # Refresh the directory mtime now and then so gc_namespaces() sees use.
+        if now - entry["touched"] > 60 and os.path.isdir(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            entry["touched"] = now
+        return entry
+
+def _configured_embedding_model() -> str:
+    return (
+        setting("EMBEDDING_MODEL")
+        or setting("OPENAI_EMBEDDING_MODEL")
         or "text-embedding-3-small"
     )
-    return OpenAIEmbeddings(model=model)
 
-def _load_vectorstore():
-    if not os.path.isdir(VECTORSTORE_DIR):
-        return None
-    try:
-        vs = FAISS.load_local(
-            VECTORSTORE_DIR,
-            _get_embeddings(),
-            allow_dangerous_deserialization=True,
-        )
-        return vs
-    except Exception:
-        return None
+def _embedding_model() -> str:
+    # Provider-qualified, so cached vectors from different backends never mix.
+    return get_provider().embedding_model_id(_configured_embedding_model())
+
+def _get_embeddings() -> "Embeddings":
+    model = _embedding_model()
+    with _VS_LOCK:
+        if model not in _EMBEDDINGS:
+            _EMBEDDINGS[model] = get_provider().embeddings(_configured_embedding_model())
+        return _EMBEDDINGS[model]
+
+def _embed_texts(texts: List[str]) -> List[List[float]]:
+    model = _embedding_model()
+    with span("rag.embed", model=model) as m:
+        cache = get_embedding_cache()
+        vectors = cache.get_many(model, texts)
+        pending: Dict[str, str] = {}
+        for text, vec in zip(texts, vectors):
+            if vec is None:
+                pending.setdefault(text_hash(text), text)
+        m["texts"] = len(texts)
+        m["cache_hits"] = len(texts) - sum(1 for v in vectors if v is None)
+        m["cache_misses"] = len(pending)
+        if pending:
+            from core.llm import api_slot
 
-def _save_vectorstore(vs: FAISS):
-    os.makedirs(VECTORSTORE_DIR, exist_ok=True)
-    vs.save_local(VECTORSTORE_DIR)
+            fresh_texts = list(pending.values())
+            m["bytes"] = sum(len(t.encode("utf-8")) for t in fresh_texts)
+            with api_slot():
+                fresh = _get_embeddings().embed_documents(fresh_texts)
+            cache.put_many(model, fresh_texts, fresh)
+            by_hash = {text_hash(t): v for t, v in zip(fresh_texts, fresh)}
+            vectors = [v if v is not None else by_hash[text_hash(t)] for t, v in zip(texts, vectors)]
+        return vectors
 
-def clear_index():
-    if os.path.isdir(VECTORSTORE_DIR):
-        for root, _, files in os.walk(VECTORSTORE_DIR, topdown=False):
+def embedding_model() -> str:
+    """Provider-qualified id of the embedding model in use."""
+    return _embedding_model()
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed ``texts`` through the persistent embedding cache."""
+    return _embed_texts(texts)
+
+def embedding_cache_stats() -> Dict[str, int]:
+    return get_embedding_cache().stats()
+
+def _get_vectorstore(namespace: Optional[str] = None) -> Optional["SegmentedIndex"]:
+    index = _entry(namespace)["index"]
+    index.refresh()
+    return index if len(index) else None
+
+def _remove_tree(path: str):
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path, topdown=False):
             for name in files:
                 try:
                     os.remove(os.path.join(root, name))
@@ -49,19 +154,170 @@ def clear_index():
             except OSError:
                 pass
 
+def clear_index(namespace: Optional[str] = None):
+    with _VS_LOCK:
+        path = _namespace_dir(namespace)
+        entry = _VS_CACHE.pop(path, None)
+        if entry is not None:
+            entry["index"].close()
+        _remove_tree(path)
+        _QUERY_RESULTS.clear()
+
+def namespace_exists(namespace: Optional[str]) -> bool:
+    """Whether ``namespace`` has an index directory, under its sanitised name."""
+    return os.path.isdir(_namespace_dir(namespace))
+
+def list_namespaces() -> List[str]:
+    if not os.path.isdir(NAMESPACES_DIR):
+        return []
+    return sorted(n for n in os.listdir(NAMESPACES_DIR) if os.path.isdir(os.path.join(NAMESPACES_DIR, n)))
+
+def gc_namespaces(max_age_days: float = NAMESPACE_TTL_DAYS) -> List[str]:
+    """Delete namespace indexes unused for ``max_age_days``; returns their names."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    with _VS_LOCK:
+        for name in list_namespaces():
+            path = os.path.join(NAMESPACES_DIR, name)
+            if path in _VS_CACHE:
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            _remove_tree(path)
+            removed.append(name)
+    return removed
+
+def _open_pdf(file_bytes: bytes) -> "PdfReader":
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(BytesIO(file_bytes))
+    if reader.is_encrypted:
+        try:
+            ok = reader.decrypt("")
+        except Exception:
+            ok = 0
+        if not ok:
+            raise ValueError("PDF is encrypted")
+    return reader
+
+def _split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in text.split("\n\n") if p.strip()]
+
+_BULLET = re.compile(r"^([-•*▪●◦]|\(?\d{1,2}[.)]|\(?[a-z][.)])\s")
+
+def _pdf_paragraphs(text: str) -> List[str]:
+    # PyPDF2 returns one line per text line and rarely a blank line, so a
+    # paragraph ends at a short line closing a sentence or before a bullet.
+    if "\n\n" in text.strip():
+        return _split_paragraphs(text)
+    lines = [line.strip() for line in text.splitlines()]
+    width = max((len(line) for line in lines), default=0)
+    paras: List[str] = []
+    buf: List[str] = []
+    for line in lines:
+        if buf and (not line or _BULLET.match(line)):
+            paras.append("\n".join(buf))
+            buf = []
+        if not line:
+            continue
+        buf.append(line)
+        if line[-1] in ".!?:" and len(line) < 0.8 * width:
+            paras.append("\n".join(buf))
+            buf = []
+    if buf:
+        paras.append("\n".join(buf))
+    return paras
+
+def _docx_rendered_breaks(paragraph) -> int:
+    return len(paragraph._p.xpath(".//w:lastRenderedPageBreak"))
+
+def _docx_explicit_breaks(paragraph) -> int:
+    return len(paragraph._p.xpath('.//w:br[@w:type="page"]'))
+
+def _iter_docx_segments(file_bytes: bytes) -> Iterator[Dict]:
+    from docx import Document
+
+    doc = Document(BytesIO(file_bytes))
+    # Word marks where it last laid out each page; a manual break usually gets
+    # both a w:br in one paragraph and a rendered marker in the next, so the
+    # two are never added. Explicit breaks are only used when nothing was
+    # rendered (e.g. files written by python-docx).
+    rendered = doc.element.body.xpath("boolean(.//w:lastRenderedPageBreak)")
+    page = 1
+    for n, p in enumerate(doc.paragraphs, start=1):
+        if rendered:
+            # The marker sits where the paragraph's text continues on a new page.
+            page += _docx_rendered_breaks(p)
+        if p.text.strip():
+            yield {"text": p.text.strip(), "page": page, "paragraph": n}
+        if not rendered:
+            page += _docx_explicit_breaks(p)
+
+def _iter_pdf_segments(reader: "PdfReader", start: int = 0, stop: Optional[int] = None) -> Iterator[Dict]:
+    stop = len(reader.pages) if stop is None else stop
+    for i in range(start, stop):
+        try:
+            page_text = reader.pages[i].extract_text() or ""
+        except Exception:
+            continue
+        for n, para in enumerate(_pdf_paragraphs(page_text), start=1):
+            yield {"text": para, "page": i + 1, "paragraph": n}
+
+def iter_segments(file_bytes: bytes, filename: str) -> Iterator[Dict]:
+    """Yield ``{"text", "page", "paragraph"}`` segments one at a time.
+
+    PDFs are read page by page and DOCX paragraph by paragraph, so callers never
+    need the whole document as one string. DOCX pages are estimated from the
+    page breaks Word stores in the file; plain text has no pages.
+
+    A PDF or DOCX that cannot be parsed raises rather than being indexed as
+    decoded bytes; ``iter_extracted`` reports it as the file's ``error``.
+    """
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        yield from _iter_pdf_segments(_open_pdf(file_bytes))
+        return
+    if name.endswith(".docx"):
+        yield from _iter_docx_segments(file_bytes)
+        return
+    text = file_bytes.decode("utf-8", errors="ignore")
+    for n, para in enumerate(_split_paragraphs(text), start=1):
+        yield {"text": para, "page": None, "paragraph": n}
+
+def segments_to_text(segments: Iterable[Dict]) -> str:
+    out: List[str] = []
+    last_page = object()
+    for seg in segments:
+        if out:
+            out.append("\n" if seg.get("page") != last_page else "\n\n")
+        out.append(seg["text"])
+        last_page = seg.get("page")
+    return "".join(out)
+
+def _file_kind(filename: str) -> str:
+    ext = os.path.splitext(filename.lower())[1].lstrip(".")
+    return ext if ext in ("pdf", "docx") else "text"
+
 def extract_text(file_bytes: bytes, filename: str) -> str:
+    with span("rag.extract_text", kind=_file_kind(filename)) as m:
+        m["bytes"] = len(file_bytes)
+        text = _extract_text(file_bytes, filename)
+        m["chars"] = len(text)
+        return text
+
+def _extract_text(file_bytes: bytes, filename: str) -> str:
     name = filename.lower()
     try:
         if name.endswith(".pdf"):
-            reader = PdfReader(BytesIO(file_bytes))
-            if reader.is_encrypted:
-                try:
-                    reader.decrypt("")
-                except Exception:
-                    pass
+            reader = _open_pdf(file_bytes)
             parts = [(p.extract_text() or "") for p in reader.pages]
             return "\n".join(parts).strip()
         elif name.endswith(".docx"):
+            from docx import Document
+
             doc = Document(BytesIO(file_bytes))
             return "\n".join(p.text for p in doc.paragraphs if p.text).strip()
         else:
@@ -69,45 +325,517 @@ def extract_text(file_bytes: bytes, filename: str) -> str:
     except Exception:
         return file_bytes.decode("utf-8", errors="ignore")
 
+PDF_PAGES_PER_TASK = 20
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_POOL_LOCK = threading.Lock()
+_POOL: Optional["ProcessPoolExecutor"] = None
+
+def _get_pool() -> "ProcessPoolExecutor":
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn rather than fork: the Streamlit server is multi-threaded.
+            _POOL = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _POOL
+
+def _reset_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+def _extract_segments(file_bytes: bytes, filename: str) -> List[Dict]:
+    return list(iter_segments(file_bytes, filename))
+
+def _extract_pdf_range(file_bytes: bytes, start: int, stop: int) -> List[Dict]:
+    return list(_iter_pdf_segments(_open_pdf(file_bytes), start, stop))
+
+def _pdf_page_count(file_bytes: bytes) -> int:
+    try:
+        return len(_open_pdf(file_bytes).pages)
+    except Exception:
+        return 0
+
+def _extraction_tasks(files: List[Tuple[bytes, str]]) -> List[Tuple[int, Callable, tuple]]:
+    tasks = []
+    for idx, (raw, filename) in enumerate(files):
+        n_pages = _pdf_page_count(raw) if filename.lower().endswith(".pdf") else 0
+        if n_pages > PDF_PAGES_PER_TASK:
+            for start in range(0, n_pages, PDF_PAGES_PER_TASK):
+                stop = min(start + PDF_PAGES_PER_TASK, n_pages)
+                tasks.append((idx, _extract_pdf_range, (raw, start, stop)))
+        else:
+            tasks.append((idx, _extract_segments, (raw, filename)))
+    return tasks
+
+def extract_texts_parallel(
+    files: List[Tuple[bytes, str]],
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> List[Dict]:
+    """Extract many (bytes, filename) uploads across processes, in input order.
+
+    Large PDFs are split into page ranges. A failure only affects its own file:
+    that entry gets an ``error`` and whatever text could still be recovered.
+    Each result also carries the page-aware ``segments`` from ``iter_segments``.
+    Use ``iter_extracted`` to index files as they finish instead of holding
+    every file's segments at once.
+    """
+    with span("rag.extract_parallel") as m:
+        results = []
+        for res in iter_extracted(files, progress):
+            res["text"] = segments_to_text(res["segments"])
+            results.append(res)
+        m["files"] = len(files)
+        m["bytes"] = sum(len(raw) for raw, _ in files)
+        m["chars"] = sum(len(r["text"]) for r in results)
+        m["file_errors"] = sum(1 for r in results if r["error"])
+        return results
+
+def iter_extracted(
+    files: List[Tuple[bytes, str]],
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> Iterator[Dict]:
+    """Yield ``{"filename", "segments", "error"}`` per file, in input order.
+
+    Extraction runs in parallel as in ``extract_texts_parallel``, but a file is
+    yielded as soon as it and every file before it are done, and its segments
+    are released once the caller moves on.
+    """
+    tasks = _extraction_tasks(files)
+    remaining = [0] * len(files)
+    for idx, _, _ in tasks:
+        remaining[idx] += 1
+    by_file: List[List[int]] = [[] for _ in files]
+    for task_no, (idx, _, _) in enumerate(tasks):
+        by_file[idx].append(task_no)
+    outputs: Dict[int, List[Dict]] = {}
+    errors: List[Optional[str]] = [None] * len(files)
+    next_idx = 0
+    for done, (task_no, segs, err) in enumerate(_run_extraction_tasks(tasks), 1):
+        idx = tasks[task_no][0]
+        outputs[task_no] = segs or []
+        if err is not None and errors[idx] is None:
+            errors[idx] = str(err) or err.__class__.__name__
+        remaining[idx] -= 1
+        if progress:
+            progress(done, len(tasks), files[idx][1])
+        while next_idx < len(files) and remaining[next_idx] == 0:
+            segments = [seg for t in by_file[next_idx] for seg in outputs.pop(t)]
+            yield {"filename": files[next_idx][1], "segments": segments, "error": errors[next_idx]}
+            next_idx += 1
+
+def _run_extraction_tasks(
+    tasks: List[Tuple[int, Callable, tuple]],
+) -> Iterator[Tuple[int, Optional[List[Dict]], Optional[BaseException]]]:
+    # (task_no, segments, error) in completion order.
+    from concurrent.futures.process import BrokenProcessPool
+
+    finished = set()
+    if EXTRACT_WORKERS > 1 and len(tasks) > 1:
+        try:
+            pool = _get_pool()
+            futures = {pool.submit(fn, *args): task_no for task_no, (_, fn, args) in enumerate(tasks)}
+            for fut in as_completed(futures):
+                task_no = futures[fut]
+                try:
+                    segs, err = fut.result(), None
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    segs, err = None, e
+                finished.add(task_no)
+                yield task_no, segs, err
+            return
+        except BrokenProcessPool:
+            _reset_pool()
+    for task_no, (_, fn, args) in enumerate(tasks):
+        if task_no in finished:
+            continue
+        try:
+            segs, err = fn(*args), None
+        except Exception as e:
+            segs, err = None, e
+        yield task_no, segs, err
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Embedding requests are packed by token count (the API limit is per request
+# tokens and 2048 inputs) and several run at once to use the account's TPM.
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_MAX_INPUTS = 2048
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+# Finished batches are published as a new index segment every this many chunks.
+SEGMENT_FLUSH_CHUNKS = int(os.getenv("SEGMENT_FLUSH_CHUNKS", "5000"))
+
 def _split_text(text: str) -> List[str]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
         separators=["\n\n", "\n", ". ", " ", ""],
     )
     return splitter.split_text(text)
 
-def upsert_documents(docs: List[Dict]):
-    texts: List[str] = []
-    metas: List[Dict] = []
+def _iter_chunks(segments: Iterable[Dict]) -> Iterator[Tuple[str, Dict]]:
+    # Consecutive paragraphs of the same page are packed up to CHUNK_SIZE before
+    # splitting, so at most about one chunk of text is buffered at a time.
+    buf: List[str] = []
+    size = 0
+    meta: Dict = {}
+
+    def _flush():
+        for chunk in _split_text("\n\n".join(buf)):
+            if chunk.strip():
+                yield chunk, dict(meta)
+
+    for seg in segments:
+        text = (seg.get("text") or "").strip()
+        if not text:
+            continue
+        if buf and (seg.get("page") != meta.get("page") or size + len(text) > CHUNK_SIZE):
+            yield from _flush()
+            buf, size = [], 0
+        if not buf:
+            meta = {k: seg[k] for k in ("page", "paragraph") if seg.get(k) is not None}
+        buf.append(text)
+        size += len(text) + 2
+    if buf:
+        yield from _flush()
+
+def _iter_doc_chunks(docs: Iterable[Dict]) -> Iterator[Tuple[str, Dict]]:
     for d in docs:
-        raw_text = d.get("text", "") or ""
         base_meta = d.get("meta", {}) or {}
+        if d.get("segments") is not None:
+            for chunk, meta in _iter_chunks(d["segments"]):
+                yield chunk, {**base_meta, **meta}
+            continue
+        raw_text = d.get("text", "") or ""
         for chunk in _split_text(raw_text):
             if not chunk.strip():
                 continue
-            texts.append(chunk)
-            metas.append(base_meta.copy())
-    if not texts:
-        return
-    embeddings = _get_embeddings()
-    vs = _load_vectorstore()
-    if vs is None:
-        vs = FAISS.from_texts(texts=texts, embedding=embeddings, metadatas=metas)
-    else:
-        vs.add_texts(texts=texts, metadatas=metas)
-    _save_vectorstore(vs)
-
-def query(q: str, k: int = 8) -> List[Dict]:
-    vs = _load_vectorstore()
-    if vs is None:
+            yield chunk, base_meta.copy()
+
+_ENCODINGS: Dict[str, Optional["tiktoken.Encoding"]] = {}
+_ENCODINGS_LOCK = threading.Lock()
+
+def _encoding(model: str = "") -> Optional["tiktoken.Encoding"]:
+    """The tokenizer for ``model``, or None if it cannot be loaded.
+
+    Embedding models use cl100k_base; chat models are looked up by name. A
+    failure (tiktoken missing, or its BPE file not downloadable) is cached
+    too, so callers fall back to a character estimate without retrying.
+    """
+    try:
+        return _ENCODINGS[model]
+    except KeyError:
+        pass
+    with _ENCODINGS_LOCK:
+        if model not in _ENCODINGS:
+            try:
+                import tiktoken
+
+                try:
+                    enc = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+                except KeyError:
+                    enc = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                enc = None
+            _ENCODINGS[model] = enc
+        return _ENCODINGS[model]
+
+def _count_tokens(text: str, model: str = "") -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+def count_tokens(text: str, model: str = "") -> int:
+    return _count_tokens(text, model)
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "") -> str:
+    """``text`` cut at a token boundary to at most ``max_tokens`` tokens."""
+    enc = _encoding(model)
+    if enc is None:
+        return text[: max_tokens * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens]).rstrip()
+
+def _iter_token_batches(
+    chunks: Iterable[Tuple[str, Dict]], max_tokens: int
+) -> Iterator[Tuple[List[str], List[Dict]]]:
+    texts: List[str] = []
+    metas: List[Dict] = []
+    tokens = 0
+    for chunk, meta in chunks:
+        n = _count_tokens(chunk)
+        if texts and (tokens + n > max_tokens or len(texts) >= EMBED_BATCH_MAX_INPUTS):
+            yield texts, metas
+            texts, metas, tokens = [], [], 0
+        texts.append(chunk)
+        metas.append(meta)
+        tokens += n
+    if texts:
+        yield texts, metas
+
+def _is_retryable(e: Exception) -> bool:
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return e.__class__.__name__ in {"RateLimitError", "APIConnectionError", "APITimeoutError"}
+
+def _retry_after(e: Exception) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _embed_batch(texts: List[str], metas: List[Dict]) -> Tuple[List[str], List[Dict], "np.ndarray"]:
+    import numpy as np
+
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            # float32 rows take a quarter of the memory of lists of Python floats.
+            return texts, metas, np.asarray(_embed_texts(texts), dtype=np.float32)
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_after(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+            time.sleep(delay)
+
+def upsert_documents(
+    docs: Iterable[Dict],
+    batch_tokens: int = EMBED_BATCH_TOKENS,
+    concurrency: int = EMBED_CONCURRENCY,
+    namespace: Optional[str] = None,
+):
+    """Chunk, embed and index ``docs``.
+
+    Each doc is ``{"text": str, "meta": dict}`` or, to stream large files,
+    ``{"segments": iter_segments(...), "meta": dict}``; streamed chunks also
+    get ``page`` and ``paragraph`` metadata. ``docs`` may itself be a
+    generator (e.g. over ``iter_extracted``) so files are chunked one by one.
+
+    Chunks are embedded in token-sized batches, ``concurrency`` at a time,
+    retrying rate limits with backoff. Finished batches are written as new
+    index segments every SEGMENT_FLUSH_CHUNKS chunks and once more at the end,
+    even if a later batch fails, in which case the first error is re-raised
+    after the in-flight batches are drained.
+
+    ``namespace`` selects a separate index (e.g. one per session or case
+    study); ``None`` is the shared knowledge base.
+    """
+    with span("rag.upsert") as m:
+        _upsert_documents(docs, batch_tokens, concurrency, namespace, m)
+
+def _upsert_documents(
+    docs: Iterable[Dict],
+    batch_tokens: int,
+    concurrency: int,
+    namespace: Optional[str],
+    m: Dict[str, float],
+):
+    error: Optional[Exception] = None
+    index = _entry(namespace)["index"]
+    buf_texts: List[str] = []
+    buf_metas: List[Dict] = []
+    buf_vectors: List["np.ndarray"] = []
+
+    def _flush():
+        if buf_texts:
+            import numpy as np
+
+            index.add(buf_texts, np.vstack(buf_vectors), buf_metas)
+            m["chunks"] = m.get("chunks", 0) + len(buf_texts)
+            m["segments_written"] = m.get("segments_written", 0) + 1
+            buf_texts.clear()
+            buf_metas.clear()
+            buf_vectors.clear()
+
+    def _drain(futures):
+        nonlocal error
+        for fut in futures:
+            try:
+                texts, metas, vectors = fut.result()
+            except Exception as e:
+                error = error or e
+                continue
+            buf_texts.extend(texts)
+            buf_metas.extend(metas)
+            buf_vectors.append(vectors)
+            if len(buf_texts) >= SEGMENT_FLUSH_CHUNKS:
+                _flush()
+
+    try:
+        embed_batch = bind_session(_embed_batch)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            pending = set()
+            for texts, metas in _iter_token_batches(_iter_doc_chunks(docs), batch_tokens):
+                if error is not None:
+                    break
+                pending.add(pool.submit(embed_batch, texts, metas))
+                # Bound the number of batches held in memory.
+                if len(pending) >= 2 * max(1, concurrency):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _drain(done)
+            _drain(as_completed(pending))
+    finally:
+        _flush()
+    if error is not None:
+        raise error
+
+def compact_index(namespace: Optional[str] = None) -> Optional[str]:
+    return _entry(namespace)["index"].compact()
+
+def rebuild_index(namespace: Optional[str] = None, index_type: str = "") -> Optional[str]:
+    """Rebuild a namespace as one segment of ``index_type`` (flat/ivf/hnsw/auto)."""
+    return _entry(namespace)["index"].rebuild(index_type)
+
+def index_report(namespace: Optional[str] = None, n_queries: int = 50, k: int = 10) -> List[Dict]:
+    return _entry(namespace)["index"].report(n_queries=n_queries, k=k)
+
+def query(
+    q: str,
+    k: int = 8,
+    namespace: Optional[str] = None,
+    mode: str = RETRIEVAL_MODE,
+) -> List[Dict]:
+    """Top-k chunks for ``q``; ``mode`` is "vector", "lexical" or "hybrid"."""
+    with span("rag.query", mode=mode) as m:
+        index = _get_vectorstore(namespace)
+        if index is None:
+            return []
+        key = (index.path, index.version, q, k, mode)
+        cached = _QUERY_RESULTS.get(key)
+        if cached is not None:
+            m["cache_hits"] = 1
+            return [dict(r) for r in cached]
+        m["cache_misses"] = 1
+        vector = _embed_query(q) if mode != "lexical" else None
+        docs = [d for d, _ in index.search(vector, k, text=q, mode=mode)]
+        results: List[Dict] = []
+        for d in docs:
+            meta = d.metadata or {}
+            item = {"text": d.page_content}
+            item.update(meta)
+            results.append(item)
+        m["results"] = len(results)
+        _QUERY_RESULTS.put(key, [dict(r) for r in results])
+        return results
+
+def _embed_query(q: str) -> List[float]:
+    key = (_embedding_model(), q)
+    vector = _QUERY_VECTORS.get(key)
+    if vector is None:
+        from core.llm import api_slot
+
+        with api_slot():
+            vector = _get_embeddings().embed_query(q)
+        _QUERY_VECTORS.put(key, vector)
+    return vector
+
+def query_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {"query_vectors": _QUERY_VECTORS.stats(), "query_results": _QUERY_RESULTS.stats()}
+
+CONTEXT_MODEL = "gpt-4o-mini"
+MMR_LAMBDA = 0.7
+_MIN_OVERLAP = 20
+
+def _join_overlapping(a: str, b: str) -> Optional[str]:
+    # Chunks come from one splitter pass with CHUNK_OVERLAP characters shared
+    # between neighbours, so a suffix/prefix match means they are adjacent.
+    if b in a:
+        return a
+    if a in b:
+        return b
+    for first, second in ((a, b), (b, a)):
+        for n in range(min(len(first), len(second), 2 * CHUNK_OVERLAP), _MIN_OVERLAP - 1, -1):
+            if first.endswith(second[:n]):
+                return first + second[n:]
+    return None
+
+def _merge_hits(hits: List[Dict]) -> List[Dict]:
+    merged: List[Dict] = []
+    for hit in hits:
+        text = (hit.get("text") or "").strip()
+        if not text:
+            continue
+        source = (hit.get("filename"), hit.get("page"))
+        for m in merged:
+            if m["source"] == source:
+                joined = _join_overlapping(m["text"], text)
+                if joined is not None:
+                    m["text"] = joined
+                    break
+        else:
+            merged.append({"text": text, "source": source, "filename": source[0], "page": source[1]})
+    # Merging can make earlier pieces overlap each other; one more pass.
+    if len(merged) > 1 and any(
+        a["source"] == b["source"] and _join_overlapping(a["text"], b["text"]) is not None
+        for i, a in enumerate(merged) for b in merged[i + 1:]
+    ):
+        return _merge_hits(merged)
+    return merged
+
+def _mmr_order(pieces: List[Dict], lam: float) -> List[Dict]:
+    if not pieces:
         return []
-    docs = vs.similarity_search(q, k=k)
-    results: List[Dict] = []
-    for d in docs:
-        meta = d.metadata or {}
-        item = {"text": d.page_content}
-        item.update(meta)
-        results.append(item)
-    return results
+    token_sets = [set(tokenize(p["text"])) for p in pieces]
+    relevance = [1.0 - i / len(pieces) for i in range(len(pieces))]
+
+    def _sim(i: int, j: int) -> float:
+        a, b = token_sets[i], token_sets[j]
+        return len(a & b) / len(a | b) if a and b else 0.0
+
+    chosen: List[int] = []
+    remaining = list(range(len(pieces)))
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: lam * relevance[i] - (1 - lam) * max((_sim(i, j) for j in chosen), default=0.0),
+        )
+        chosen.append(best)
+        remaining.remove(best)
+    return [pieces[i] for i in chosen]
+
+def build_context(
+    hits: List[Dict],
+    max_tokens: int,
+    model: str = CONTEXT_MODEL,
+    lam: float = MMR_LAMBDA,
+    separator: str = "\n\n",
+) -> str:
+    """Pack retrieved chunks into at most ``max_tokens`` tokens of ``model``.
+
+    Overlapping or adjacent chunks from the same file/page are merged,
+    near-duplicates are pushed back by MMR (token-set similarity), and the
+    last piece that does not fit is cut at a token boundary.
+    """
+    # Counting and cutting fall back to ~4 characters per token when the
+    # tokenizer cannot be loaded (e.g. offline without cached BPE files).
+    sep_tokens = _count_tokens(separator, model)
+    out: List[str] = []
+    used = 0
+    for piece in _mmr_order(_merge_hits(hits), lam):
+        cost = _count_tokens(piece["text"], model) + (sep_tokens if out else 0)
+        if used + cost <= max_tokens:
+            out.append(piece["text"])
+            used += cost
+            continue
+        room = max_tokens - used - (sep_tokens if out else 0)
+        if room >= 50:
+            out.append(truncate_tokens(piece["text"], room, model))
+        break
+    return separator.join(out)
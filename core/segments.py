@@ -0,0 +1,509 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from core.lexical import MAX_DF_RATIO, LexicalIndex, bm25_idf, rrf_fuse, tokenize
+from core.metrics import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only.
+    fcntl = None
+
+MANIFEST = "manifest.json"
+LEXICAL_FILE = "lexical.pkl"
+COMPACT_MIN_SEGMENTS = int(os.getenv("COMPACT_MIN_SEGMENTS", "4"))
+COMPACT_SMALL_CHUNKS = int(os.getenv("COMPACT_SMALL_CHUNKS", "20000"))
+# Retired segments stay on disk this long so readers holding an older
+# manifest can still load them.
+RETIRE_GRACE_SECONDS = 600
+
+# "flat" is exact search; "ivf" and "hnsw" are approximate. "auto" picks by
+# segment size: flat while exact search is cheap, HNSW (no training) for mid
+# sized corpora and IVF with trained centroids for the largest ones.
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+AUTO_FLAT_MAX = int(os.getenv("AUTO_FLAT_MAX", "20000"))
+AUTO_HNSW_MAX = int(os.getenv("AUTO_HNSW_MAX", "500000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# IVF needs roughly 39 training points per centroid.
+IVF_MIN_VECTORS = 39 * 64
+
+def choose_index_type(n: int, requested: str = "") -> str:
+    requested = requested or INDEX_TYPE
+    if requested in ("flat", "hnsw"):
+        return requested
+    if requested == "ivf":
+        return "ivf" if n >= IVF_MIN_VECTORS else "flat"
+    if n <= AUTO_FLAT_MAX:
+        return "flat"
+    if n <= AUTO_HNSW_MAX:
+        return "hnsw"
+    return "ivf"
+
+def _ivf_nlist(n: int) -> int:
+    return max(64, min(int(4 * np.sqrt(n)), n // 39))
+
+def tune_index(index) -> "faiss.Index":
+    # Search-time knobs and the IVF direct map are not always restored on load.
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+        try:
+            index.make_direct_map()
+        except RuntimeError:
+            pass
+    return index
+
+def build_faiss_index(vectors: np.ndarray, index_type: str) -> "faiss.Index":
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, _ivf_nlist(n))
+        index.train(vectors)
+    else:
+        index = faiss.IndexFlatL2(d)
+    index.add(vectors)
+    return tune_index(index)
+
+def _exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index.search(queries, k)[1]
+
+def index_type_of(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+@contextmanager
+def _file_lock(path: str):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+def _remove_segment_dir(path: str):
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        try:
+            os.remove(os.path.join(path, name))
+        except OSError:
+            pass
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+def segment_rows(vs: FAISS, vectors: bool = True) -> Tuple[List[str], List[Dict], Optional[np.ndarray]]:
+    ids = [vs.index_to_docstore_id[i] for i in range(vs.index.ntotal)]
+    docs = [vs.docstore.search(doc_id) for doc_id in ids]
+    vectors = tune_index(vs.index).reconstruct_n(0, vs.index.ntotal) if vectors else None
+    return [d.page_content for d in docs], [dict(d.metadata or {}) for d in docs], vectors
+
+class SegmentedIndex:
+    """Append-only FAISS index made of immutable segment directories.
+
+    Every write saves a new segment and then atomically replaces
+    ``manifest.json`` (under a file lock) to publish it, so the cost of an
+    ingest is proportional to its own size and concurrent writers cannot
+    clobber each other. Queries fan out over all listed segments; small
+    segments are periodically merged by ``compact()``. Each segment also
+    carries a BM25 ``LexicalIndex`` for lexical and hybrid search.
+    """
+
+    def __init__(self, path: str, embeddings: Callable):
+        self.path = path
+        self._embeddings = embeddings
+        self._lock = threading.RLock()
+        self._manifest: Dict = {"version": None, "segments": [], "retired": []}
+        self._manifest_stat = None
+        self._loaded: Dict[str, FAISS] = {}
+        self._lexical: Dict[str, LexicalIndex] = {}
+        self._merging = False
+        self._closed = False
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._manifest["version"]
+
+    def __len__(self) -> int:
+        return sum(s["count"] for s in self._manifest["segments"])
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST)
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return {"version": None, "segments": [], "retired": []}
+        data.setdefault("retired", [])
+        return data
+
+    def _write_manifest(self, manifest: Dict):
+        tmp = os.path.join(self.path, f".{MANIFEST}.{uuid.uuid4().hex}")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self._manifest_path())
+
+    def _migrate_legacy(self):
+        # A single-directory index from before segments becomes segment "legacy".
+        if not os.path.exists(os.path.join(self.path, "index.faiss")):
+            return
+        with _file_lock(self.path):
+            if os.path.exists(self._manifest_path()):
+                return
+            seg_dir = os.path.join(self.path, "legacy")
+            os.makedirs(seg_dir, exist_ok=True)
+            for name in ("index.faiss", "index.pkl"):
+                os.replace(os.path.join(self.path, name), os.path.join(seg_dir, name))
+            vs = self._load_segment("legacy")
+            count = vs.index.ntotal if vs is not None else 0
+            self._write_manifest(
+                {"version": uuid.uuid4().hex, "segments": [{"name": "legacy", "count": count}], "retired": []}
+            )
+
+    def refresh(self) -> Optional[str]:
+        """Pick up a manifest written by another session or process."""
+        with self._lock:
+            try:
+                st = os.stat(self._manifest_path())
+                stat = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    self._apply({"version": None, "segments": [], "retired": []}, None)
+                    return None
+                self._migrate_legacy()
+                try:
+                    st = os.stat(self._manifest_path())
+                    stat = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    return None
+            if stat != self._manifest_stat:
+                self._apply(self._read_manifest(), stat)
+            return self.version
+
+    def _apply(self, manifest: Dict, stat):
+        self._manifest = manifest
+        self._manifest_stat = stat
+        live = {s["name"] for s in manifest["segments"]}
+        for cache in (self._loaded, self._lexical):
+            for name in list(cache):
+                if name not in live:
+                    del cache[name]
+
+    def _load_segment(self, name: str) -> Optional[FAISS]:
+        path = os.path.join(self.path, name)
+        with span("index.load_segment") as m:
+            try:
+                vs = FAISS.load_local(path, self._embeddings(), allow_dangerous_deserialization=True)
+            except Exception:
+                m["load_errors"] = 1
+                return None
+            m["vectors"] = vs.index.ntotal
+            m["bytes"] = sum(
+                os.path.getsize(os.path.join(path, f)) for f in ("index.faiss", "index.pkl")
+                if os.path.exists(os.path.join(path, f))
+            )
+        tune_index(vs.index)
+        return vs
+
+    def segments(self) -> List[Tuple[str, FAISS]]:
+        with self._lock:
+            out = []
+            for seg in self._manifest["segments"]:
+                vs = self._loaded.get(seg["name"])
+                if vs is None:
+                    vs = self._load_segment(seg["name"])
+                    if vs is None:
+                        continue
+                    self._loaded[seg["name"]] = vs
+                out.append((seg["name"], vs))
+            return out
+
+    def _lexical_for(self, name: str, vs: FAISS) -> LexicalIndex:
+        with self._lock:
+            lex = self._lexical.get(name)
+            if lex is not None:
+                return lex
+            path = os.path.join(self.path, name, LEXICAL_FILE)
+            try:
+                lex = LexicalIndex.load(path)
+            except Exception:
+                # Segments written before lexical indexing: build it once.
+                lex = LexicalIndex.build(segment_rows(vs, vectors=False)[0])
+                try:
+                    lex.save(path)
+                except OSError:
+                    pass
+            self._lexical[name] = lex
+            return lex
+
+    def _build(self, texts: Sequence[str], vectors, metas: Sequence[Dict], index_type: str = "") -> FAISS:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = build_faiss_index(vectors, choose_index_type(len(texts), index_type))
+        ids = [uuid.uuid4().hex for _ in texts]
+        docstore = InMemoryDocstore(
+            {i: Document(page_content=t, metadata=dict(m)) for i, t, m in zip(ids, texts, metas)}
+        )
+        return FAISS(
+            embedding_function=self._embeddings(),
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids)),
+        )
+
+    def _write_segment(self, vs: FAISS, texts: Sequence[str]) -> Dict:
+        name = f"seg-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        vs.save_local(os.path.join(self.path, name))
+        lex = LexicalIndex.build(texts)
+        lex.save(os.path.join(self.path, name, LEXICAL_FILE))
+        with self._lock:
+            self._lexical[name] = lex
+        return {"name": name, "count": vs.index.ntotal, "type": index_type_of(vs.index)}
+
+    def close(self):
+        # Used when the index directory is deleted: nothing may publish to it.
+        with self._lock:
+            self._closed = True
+            self._apply({"version": None, "segments": [], "retired": []}, None)
+
+    def _commit(self, add: List[Dict], remove: Sequence[str] = ()) -> Optional[str]:
+        with self._lock:
+            if self._closed:
+                return None
+            with _file_lock(self.path):
+                manifest = self._read_manifest()
+                names = {s["name"] for s in manifest["segments"]}
+                if any(r not in names for r in remove):
+                    # Someone else already replaced these segments.
+                    return None
+                now = time.time()
+                retired = [r for r in manifest["retired"] if now - r["at"] < RETIRE_GRACE_SECONDS]
+                for r in manifest["retired"]:
+                    if r not in retired:
+                        _remove_segment_dir(os.path.join(self.path, r["name"]))
+                retired += [{"name": r, "at": now} for r in remove]
+                manifest = {
+                    "version": uuid.uuid4().hex,
+                    "segments": [s for s in manifest["segments"] if s["name"] not in remove] + add,
+                    "retired": retired,
+                }
+                self._write_manifest(manifest)
+                st = os.stat(self._manifest_path())
+                self._apply(manifest, (st.st_mtime_ns, st.st_size))
+                return manifest["version"]
+
+    def add(self, texts: Sequence[str], vectors, metas: Sequence[Dict]) -> Optional[str]:
+        if not texts or self._closed:
+            return self.version
+        os.makedirs(self.path, exist_ok=True)
+        vs = self._build(texts, vectors, metas)
+        seg = self._write_segment(vs, texts)
+        with self._lock:
+            self._loaded[seg["name"]] = vs
+        version = self._commit([seg])
+        self.maybe_compact_async()
+        return version
+
+    def _vector_hits(self, vector: Sequence[float], k: int) -> List[Tuple[str, Document, float]]:
+        q = np.asarray([vector], dtype=np.float32)
+        hits = []
+        for name, vs in self.segments():
+            with span("index.search", type=index_type_of(vs.index)):
+                dist, pos = vs.index.search(q, min(k, vs.index.ntotal))
+            for d, p in zip(dist[0], pos[0]):
+                if p < 0:
+                    continue
+                doc = vs.docstore.search(vs.index_to_docstore_id[int(p)])
+                hits.append((f"{name}:{p}", doc, float(d)))
+        # All segments use L2 distance, so lower scores are better everywhere.
+        hits.sort(key=lambda h: h[2])
+        return hits[:k]
+
+    def _lexical_hits(self, text: str, k: int) -> List[Tuple[str, Document, float]]:
+        terms = list(dict.fromkeys(tokenize(text)))
+        segs = [(name, vs, self._lexical_for(name, vs)) for name, vs in self.segments()]
+        n_docs = sum(lex.n_docs for _, _, lex in segs)
+        if not terms or not n_docs:
+            return []
+        # BM25 statistics are corpus-wide so scores compare across segments.
+        avgdl = (sum(lex.total_len for _, _, lex in segs) / n_docs) or 1.0
+        df = {t: sum(lex.doc_freq(t) for _, _, lex in segs) for t in terms}
+        terms = [t for t in terms if df[t]]
+        terms = [t for t in terms if df[t] <= MAX_DF_RATIO * n_docs] or terms
+        idf = {t: bm25_idf(df[t], n_docs) for t in terms}
+        hits = []
+        for name, vs, lex in segs:
+            for p, score in lex.top(terms, idf, avgdl, k):
+                doc = vs.docstore.search(vs.index_to_docstore_id[p])
+                hits.append((f"{name}:{p}", doc, score))
+        hits.sort(key=lambda h: h[2], reverse=True)
+        return hits[:k]
+
+    def search(
+        self,
+        vector: Optional[Sequence[float]],
+        k: int,
+        text: str = "",
+        mode: str = "vector",
+    ) -> List[Tuple[Document, float]]:
+        """Top-k ``(document, score)`` pairs.
+
+        ``mode`` is "vector" (L2 distance, lower is better), "lexical" (BM25
+        over ``text``) or "hybrid" (reciprocal rank fusion of both).
+        """
+        if mode == "lexical":
+            return [(doc, score) for _, doc, score in self._lexical_hits(text, k)]
+        if mode != "hybrid" or not text:
+            return [(doc, score) for _, doc, score in self._vector_hits(vector, k)]
+        depth = max(4 * k, 20)
+        dense = self._vector_hits(vector, depth)
+        sparse = self._lexical_hits(text, depth)
+        docs = {key: doc for key, doc, _ in dense + sparse}
+        fused = rrf_fuse([[key for key, _, _ in dense], [key for key, _, _ in sparse]])
+        return [(docs[key], score) for key, score in fused[:k]]
+
+    def _small_segments(self) -> List[Dict]:
+        return [s for s in self._manifest["segments"] if s["count"] < COMPACT_SMALL_CHUNKS]
+
+    def _needs_rebuild(self) -> bool:
+        # Rebuild everything once the corpus outgrows the index type of its
+        # largest segment, or doubles past a trained IVF (stale centroids).
+        segs = self._manifest["segments"]
+        if len(segs) < 2:
+            return False
+        total = len(self)
+        want = choose_index_type(total)
+        if want == "flat":
+            return False
+        largest = max(segs, key=lambda s: s["count"])
+        return largest.get("type", "flat") != want or largest["count"] * 2 < total
+
+    def _merge(self, names: List[str], index_type: str = "") -> Optional[str]:
+        texts: List[str] = []
+        metas: List[Dict] = []
+        vectors = []
+        with self._lock:
+            loaded = [self._loaded.get(n) or self._load_segment(n) for n in names]
+        for vs in loaded:
+            if vs is None:
+                return None
+            t, m, v = segment_rows(vs)
+            texts.extend(t)
+            metas.extend(m)
+            vectors.append(v)
+        merged = self._build(texts, np.vstack(vectors), metas, index_type)
+        seg = self._write_segment(merged, texts)
+        version = self._commit([seg], remove=names)
+        if version is None:
+            _remove_segment_dir(os.path.join(self.path, seg["name"]))
+            return None
+        with self._lock:
+            self._loaded[seg["name"]] = merged
+        return version
+
+    def compact(self) -> Optional[str]:
+        """Merge small segments, or rebuild all of them when the index type
+        policy calls for it; returns the new version if anything ran."""
+        self.refresh()
+        if self._needs_rebuild():
+            return self._merge([s["name"] for s in self._manifest["segments"]])
+        small = self._small_segments()
+        if len(small) < COMPACT_MIN_SEGMENTS:
+            return None
+        return self._merge([s["name"] for s in small])
+
+    def rebuild(self, index_type: str = "") -> Optional[str]:
+        self.refresh()
+        names = [s["name"] for s in self._manifest["segments"]]
+        return self._merge(names, index_type) if names else None
+
+    def report(self, n_queries: int = 50, k: int = 10, types: Sequence[str] = ("flat", "ivf", "hnsw")) -> List[Dict]:
+        """Recall@k and per-query latency of each index type against exact search.
+
+        Queries are stored vectors with a little noise added, so the report
+        needs no embedding calls.
+        """
+        self.refresh()
+        parts = [segment_rows(vs)[2] for _, vs in self.segments()]
+        if not parts:
+            return []
+        vectors = np.ascontiguousarray(np.vstack(parts), dtype=np.float32)
+        n = vectors.shape[0]
+        k = min(k, n)
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, size=min(n_queries, n), replace=False)]
+        queries = sample + rng.normal(0, 0.01, sample.shape).astype(np.float32)
+        baseline = _exact_neighbours(vectors, queries, k)
+        rows = []
+        for index_type in types:
+            if index_type == "ivf" and n < IVF_MIN_VECTORS:
+                rows.append({"type": index_type, "vectors": n, "skipped": "too few vectors to train"})
+                continue
+            t0 = time.perf_counter()
+            index = build_faiss_index(vectors, index_type)
+            build_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for q in queries:
+                index.search(q[None, :], k)
+            latency_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            _, found = index.search(queries, k)
+            recall = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(found, baseline)]))
+            rows.append(
+                {
+                    "type": index_type,
+                    "vectors": n,
+                    "build_s": round(build_s, 4),
+                    "latency_ms": round(latency_ms, 4),
+                    f"recall@{k}": round(recall, 4),
+                }
+            )
+        return rows
+
+    def maybe_compact_async(self):
+        with self._lock:
+            if self._merging or (
+                len(self._small_segments()) < COMPACT_MIN_SEGMENTS and not self._needs_rebuild()
+            ):
+                return
+            self._merging = True
+
+        def _run():
+            try:
+                self.compact()
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._merging = False
+
+        threading.Thread(target=_run, name=f"compact:{self.path}", daemon=True).start()
@@ -0,0 +1,8 @@
+import uuid
+import streamlit as st
+
+def get_namespace() -> str:
+    """Knowledge-base namespace for this browser session (one case study)."""
+    if "kb_namespace" not in st.session_state:
+        st.session_state["kb_namespace"] = uuid.uuid4().hex
+    return st.session_state["kb_namespace"]
@@ -21,6 +21,7 @@ Use the sidebar or the step pages to move through the journey:
 6. Summary & Download  
 Chat with Your Case Study & Materials  
 About Us  
+Metrics (admin)  
 
 """
 )
@@ -1,7 +1,8 @@
 import streamlit as st
 from core.auth import require_password
-from core.rag import extract_text, upsert_documents, clear_index
-from core.llm import chat
+from core.rag import iter_extracted, segments_to_text, upsert_documents, clear_index, embedding_cache_stats, gc_namespaces
+from core.session import get_namespace
+from core.analysis import missing_info_questions
 from core.utils import parse_questions_list
 from core.nav import next_page
 
@@ -10,9 +11,15 @@ require_password()
 
 st.title("📤 Step 1 — Upload & Analyze")
 
+namespace = get_namespace()
+if not st.session_state.get("kb_gc_done"):
+    gc_namespaces()
+    st.session_state["kb_gc_done"] = True
+
 with st.expander("Clear Knowledge Base"):
+    st.caption("Only the documents uploaded in this session are cleared.")
     if st.button("🧹 Reset Knowledge Base (clear vector index)"):
-        clear_index()
+        clear_index(namespace)
         st.session_state.pop("missing_questions", None)
         st.session_state.pop("missing_questions_text", None)
         st.success("Knowledge base cleared.")
@@ -24,46 +31,43 @@ uploads = st.file_uploader(
 )
 
 if st.button("Ingest & Analyze") and uploads:
-    texts = []
-    docs_for_index = []
-
-    for f in uploads:
-        raw = f.read()
-        t = extract_text(raw, f.name)
-        texts.append(t)
-        docs_for_index.append(
-            {
-                "text": t,
-                "meta": {"filename": f.name, "source": "user_upload"},
-            }
-        )
+    docs_for_analysis = []
 
-    upsert_documents(docs_for_index)
-    st.success("✅ Ingested & indexed documents into the knowledge base.")
+    bar = st.progress(0.0, text="Extracting text...")
 
-    corpus_sample = "\n\n".join([t[:1500] for t in texts])[:4000]
-    prompt = f"""You are assisting to prepare a public-sector finance CASE STUDY.
+    def _on_progress(done, total, filename):
+        bar.progress(done / total, text=f"Extracting & indexing... {done}/{total} ({filename})")
 
-Based on the following uploaded content (may be partial), list the
-MISSING INFORMATION we must ask the user as bullet questions.
+    def _docs_for_index():
+        # One file's segments at a time go to the indexer as extraction finishes.
+        for res in iter_extracted([(f.getvalue(), f.name) for f in uploads], progress=_on_progress):
+            if res["error"]:
+                st.warning(f"Could not fully read **{res['filename']}**: {res['error']}")
+            docs_for_analysis.append((res["filename"], segments_to_text(res["segments"])))
+            yield {
+                "segments": res["segments"],
+                "meta": {"filename": res["filename"], "source": "user_upload"},
+            }
+
+    before = embedding_cache_stats()
+    upsert_documents(_docs_for_index(), namespace=namespace)
+    after = embedding_cache_stats()
+    bar.empty()
+    st.success("✅ Ingested & indexed documents into the knowledge base.")
+    st.caption(
+        f"Embedding cache: {after['hits'] - before['hits']} chunks reused, "
+        f"{after['misses'] - before['misses']} newly embedded."
+    )
 
-Cover:
-- title direction
-- executive summary angle
-- problem clarity
-- implementation specifics (timeline, roles, tools)
-- benefits with metrics
-- key learning points
-- POC contact details
+    bar = st.progress(0.0, text="Analysing materials...")
 
-Content sample:
----
-{corpus_sample}
----
+    def _on_sheet(done, total):
+        bar.progress(done / total, text=f"Summarising materials... {done}/{total}")
 
-Return only bullet questions (can be 0, max 3).
-"""
-    qs = chat([{"role": "user", "content": prompt}])
+    qs, sheets, failed = missing_info_questions(docs_for_analysis, progress=_on_sheet)
+    bar.empty()
+    for sources in failed:
+        st.warning(f"Part of **{sources}** could not be summarised and was left out of the analysis.")
 
     st.session_state["missing_questions_text"] = qs
     st.session_state["missing_questions"] = parse_questions_list(qs)
@@ -71,6 +75,9 @@ Return only bullet questions (can be 0, max 3).
     st.success("🔎 Analysis complete. Proceed to **2️⃣ Fill Missing Info**.")
     with st.expander("See suggested questions"):
         st.markdown(qs)
+    if sheets:
+        with st.expander(f"Fact sheets ({len(sheets)})"):
+            st.markdown("\n\n".join(sheets))
 
 st.divider()
 if st.session_state.get("missing_questions"):
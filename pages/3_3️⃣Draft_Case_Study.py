@@ -1,7 +1,10 @@
 import streamlit as st
 from core.auth import require_password
-from core.rag import query
-from core.llm import chat
+from core.rag import build_context, query
+from core.session import get_namespace
+from core.llm import CHAT_MODEL, chat_stream
+from core.prompts import draft_prompt, retrieval_query
+from core.drafting import draft_sections, section_headings
 from core.nav import next_page
 
 st.set_page_config(page_title="Draft Case Study", page_icon="📄", layout="wide")
@@ -19,6 +22,12 @@ topic_hint = st.text_input(
     value="finance transformation, case study",
 )
 
+parallel = st.toggle(
+    "Draft sections in parallel (faster)",
+    value=True,
+    help="Retrieve and write each section separately and concurrently, instead of one long generation.",
+)
+
 st.markdown(
     "When you click **Draft Now**, the app will:\n"
     "- 🔍 Use **RAG** to fetch relevant snippets from your uploaded materials\n"
@@ -26,45 +35,29 @@ st.markdown(
 )
 
 if st.button("Draft Now"):
-    answers_text = "\n".join([f"{k}: {v}" for k, v in answers.items() if v.strip()])
-    retrieval_query = (answers_text + "\n\n" + topic_hint).strip()
-
-    ctx_docs = query(retrieval_query, k=10)
-    context_text = "\n\n".join([d.get("text", "") for d in ctx_docs]) or "(no retrieved context)"
-
-    prompt = f"""You are a professional case study writer for public-sector finance.
-
-Use BOTH:
-1) CONTEXT: excerpts from source materials
-2) USER ANSWERS: structured information from a form
-
-to draft a polished, visually engaging case study with the following sections:
-
-1) Captivating Title
-2) Executive Summary (3–5 sentences)
-3) Problem / Need for the project
-4) Implementation Approach (timeline, roles, tools, governance)
-5) Benefits & Impact (quantify where possible)
-6) Key Learning Points (bulleted)
-7) Point of Contact (POC: name, role, email — use placeholders if missing)
-8) Suggested Visuals/Diagrams (list 2–3 ideas)
-
-Make sure the narrative aligns closely with the CONTEXT, and only fill gaps using reasonable inference.
-
-CONTEXT (retrieved via RAG):
------------------------------
-{context_text}
-
-USER ANSWERS:
--------------
-{answers_text}
-
-Return **Markdown only**.
-"""
-    draft = chat([{"role": "user", "content": prompt}])
+    usage = {}
+    if parallel:
+        slots = {heading: st.empty() for heading in section_headings()}
+        for heading, slot in slots.items():
+            slot.caption(f"⏳ {heading}…")
+
+        def show(heading, body):
+            slots[heading].markdown(f"## {heading}\n{body}")
+
+        draft = draft_sections(answers, topic_hint, get_namespace(), on_section=show)
+        for slot in slots.values():
+            slot.empty()
+        st.markdown(draft)
+    else:
+        ctx_docs = query(retrieval_query(answers, topic_hint), k=16, namespace=get_namespace())
+        context_text = build_context(ctx_docs, max_tokens=3000, model=CHAT_MODEL) or "(no retrieved context)"
+
+        prompt = draft_prompt(context_text, answers)
+        draft = st.write_stream(chat_stream([{"role": "user", "content": prompt}], usage=usage))
     st.session_state["case_markdown"] = draft
-    st.success("✅ Draft ready. See below and proceed to **4️⃣ Generate Visuals**.")
-    st.markdown(draft)
+    st.success("✅ Draft ready. See above and proceed to **4️⃣ Generate Visuals**.")
+    if usage:
+        st.caption(f"Tokens: {usage['prompt_tokens']} in / {usage['completion_tokens']} out")
 
 st.divider()
 if st.session_state.get("case_markdown"):
@@ -1,6 +1,8 @@
 import streamlit as st
 from core.auth import require_password
-from core.llm import chat, generate_image
+from core.blobs import get_blob_store
+from core.llm import chat, generate_image, generate_images
+from core.prompts import cover_image_prompt, diagram_image_prompt, diagram_suggestions_prompt, parse_suggestions
 from core.nav import next_page
 
 st.set_page_config(page_title="Generate Visuals", page_icon="🖼️", layout="wide")
@@ -24,14 +26,15 @@ theme = st.text_input(
     value="public finance, collaboration, knowledge sharing, AI assistance, case studies",
 )
 
+cover_prompt = cover_image_prompt(style, theme)
+
 if st.button("Generate Cover Image (1024x1024)"):
-    prompt = (
-        f"A {style} depicting {theme}. Clean, professional, government context, minimal color palette."
-    )
+    prompt = cover_prompt
     try:
         png_bytes = generate_image(prompt, size="1024x1024")
-        st.image(png_bytes, caption="Cover Image", use_column_width=True)
-        st.session_state["cover_image"] = png_bytes
+        handle = get_blob_store().put(png_bytes)
+        st.image(get_blob_store().thumbnail(handle), caption="Cover Image")
+        st.session_state["cover_image"] = handle
         st.success("✅ Cover image generated.")
     except Exception as e:
         st.error(str(e))
@@ -39,15 +42,12 @@ if st.button("Generate Cover Image (1024x1024)"):
 st.divider()
 st.subheader("Auto-create Simple Diagram Prompts")
 
+fresh_prompts = st.checkbox("Ask the AI again instead of reusing earlier suggestions", key="diag_fresh")
 if st.button("Suggest Diagram Prompts from Draft"):
-    p = f"""From the following case study markdown, list three concise prompts for diagrams/flowcharts to visualise the process and impact.
-Return bullet points only (max 3 prompts).
----
-{draft[:5000]}
----"""
-    out = chat([{"role": "user", "content": p}])
+    p = diagram_suggestions_prompt(draft)
+    out = chat([{"role": "user", "content": p}], cache="refresh" if fresh_prompts else True)
     st.session_state["diagram_prompts_raw"] = out
-    prompts = [line.strip("-• ").strip() for line in out.splitlines() if line.strip()]
+    prompts = parse_suggestions(out)
     st.session_state["diagram_prompts"] = prompts
     st.success("✅ Diagram prompts generated. Choose which to create below.")
     st.markdown(out)
@@ -60,19 +60,32 @@ if prompts:
         if st.checkbox(f"{i}. {prompt}", key=f"diag_{i}"):
             selected.append(prompt)
 
+    with_cover = st.checkbox("Also generate the cover image in the same batch", value=False)
+
     if selected and st.button("🎨 Generate Selected Diagrams"):
         generated_images = st.session_state.get("diagram_images", {})
-        for p in selected:
-            try:
-                st.write(f"Generating: *{p}* ...")
-                img_bytes = generate_image(
-                    f"Professional flowchart or process diagram showing: {p}. Minimal style.",
-                    size="1024x1024",
-                )
-                st.image(img_bytes, caption=p, use_column_width=True)
-                generated_images[p] = img_bytes
-            except Exception as e:
-                st.error(f"Failed to generate diagram '{p}': {e}")
+        image_prompts = [diagram_image_prompt(p) for p in selected]
+        captions = list(selected)
+        if with_cover:
+            image_prompts.append(cover_prompt)
+            captions.append("Cover Image")
+        slots = []
+        for caption in captions:
+            slot = st.empty()
+            slot.write(f"Generating: *{caption}* ...")
+            slots.append(slot)
+        for i, img_bytes, err in generate_images(image_prompts, size="1024x1024"):
+            caption = captions[i]
+            if err:
+                slots[i].error(f"Failed to generate '{caption}': {err}")
+                continue
+            # Session state keeps blob handles; the PNGs stay on disk.
+            handle = get_blob_store().put(img_bytes)
+            slots[i].image(get_blob_store().thumbnail(handle), caption=caption)
+            if with_cover and i == len(captions) - 1:
+                st.session_state["cover_image"] = handle
+            else:
+                generated_images[caption] = handle
         st.session_state["diagram_images"] = generated_images
         st.success("✅ Selected diagrams generated.")
 
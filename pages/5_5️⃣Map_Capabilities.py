@@ -1,6 +1,8 @@
 import streamlit as st
 from core.auth import require_password
 from core.llm import chat
+from core.mapping import SHORTLIST_SIZE, shortlist
+from core.prompts import mapping_prompt
 from core.utils import get_all_best_practices, parse_bp_ids
 from core.nav import next_page
 
@@ -25,35 +27,22 @@ st.markdown(
 with st.expander("View case study draft"):
     st.markdown(case_md)
 
+fresh_mapping = st.checkbox("Ask the AI again instead of reusing earlier suggestions", key="bp_fresh")
 if st.button("🤖 Suggest Best Practice Statements"):
-    bp_list_str = "\n".join(
-        f"{bp['metric_id']}: {bp['capability']} – {bp['statement']}"
-        for bp in bps
-    )
-    prompt = f"""You are mapping a finance transformation case study to a capability framework.
-
-You are given:
-1) The CASE STUDY text.
-2) A list of CAPABILITY BEST PRACTICE STATEMENTS, each with a metric ID.
-
-Task:
-- Select ALL best practice statements that clearly apply to this case.
-- Return only their metric IDs as a bullet list (e.g. "- 1.1.1").
-
-CASE STUDY:
-----------------
-{case_md[:6000]}
-
-CAPABILITY BEST PRACTICE STATEMENTS:
-----------------
-{bp_list_str}
-"""
-    out = chat([{"role": "user", "content": prompt}])
+    # Rank the framework locally; only the closest statements go to the LLM.
+    candidates = shortlist(case_md, bps, SHORTLIST_SIZE)
+    prompt = mapping_prompt(case_md, [bp for bp, _ in candidates])
+    out = chat([{"role": "user", "content": prompt}], cache="refresh" if fresh_mapping else True)
     st.session_state["bp_suggestion_raw"] = out
-    suggested_ids = parse_bp_ids(out)
+    shortlisted = {bp["metric_id"] for bp, _ in candidates}
+    suggested_ids = [mid for mid in parse_bp_ids(out) if mid in shortlisted]
     st.session_state["bp_suggested_ids"] = suggested_ids
 
     st.success("✅ Suggested best practice statements identified.")
+    if len(candidates) < len(bps):
+        with st.expander(f"Shortlisted {len(candidates)} of {len(bps)} statements for the AI"):
+            for bp, score in candidates:
+                st.markdown(f"- `{bp['metric_id']}` ({score:.2f}) {bp['statement']}")
     with st.expander("See raw AI suggestion"):
         st.markdown(out)
 
@@ -1,7 +1,8 @@
 import streamlit as st
 from core.auth import require_password
-from core.rag import query
-from core.llm import chat
+from core.session import get_namespace
+from core.llm import CHAT_MODEL, chat_stream
+from core.memory import ConversationMemory, case_context, is_follow_up, trim_question
 
 st.set_page_config(page_title="Chat with Materials", page_icon="💬", layout="wide")
 require_password()
@@ -28,31 +29,48 @@ if mode == "Final case study only" and not case_md:
     st.warning("No case study draft found. Please complete the drafting step first.")
     st.stop()
 
-if "chat_history" not in st.session_state:
-    st.session_state["chat_history"] = []
+if "chat_memory" not in st.session_state:
+    st.session_state["chat_memory"] = ConversationMemory(CHAT_MODEL)
+memory = st.session_state["chat_memory"]
 
-for role, content in st.session_state["chat_history"]:
+if memory.display and st.button("🧹 Clear conversation"):
+    memory.clear()
+    st.rerun()
+
+for role, content in memory.display:
     st.chat_message(role).markdown(content)
 
 user_input = st.chat_input("Ask a question about your materials or case study...")
 if not user_input:
     st.stop()
 
-st.session_state["chat_history"].append(("user", user_input))
 st.chat_message("user").markdown(user_input)
+question = trim_question(user_input, CHAT_MODEL)
+
+if mode == "Uploaded materials (RAG)":
+    context_key = f"rag:{get_namespace()}"
+else:
+    context_key = f"case:{hash(case_md)}"
+# Follow-ups ("and how long did that take?") reuse the previous turn's context.
+reused = memory.context_key == context_key and is_follow_up(question, memory)
 
 if mode == "Uploaded materials (RAG)":
-    ctx_docs = query(user_input, k=8)
-    if not ctx_docs:
-        answer = (
-            "I couldn't find any indexed content yet. "
-            "Please go to **Step 1 – Upload & Analyze** to ingest documents first."
-        )
-        st.session_state["chat_history"].append(("assistant", answer))
-        st.chat_message("assistant").markdown(answer)
-        st.stop()
-
-    context_text = "\n\n".join(d.get("text", "") for d in ctx_docs)
+    if reused:
+        context_text = memory.context
+    else:
+        from core.rag import build_context, query
+
+        ctx_docs = query(question, k=12, namespace=get_namespace())
+        if not ctx_docs:
+            answer = (
+                "I couldn't find any indexed content yet. "
+                "Please go to **Step 1 – Upload & Analyze** to ingest documents first."
+            )
+            memory.add("user", user_input)
+            memory.add("assistant", answer)
+            st.chat_message("assistant").markdown(answer)
+            st.stop()
+        context_text = build_context(ctx_docs, max_tokens=2000, model=CHAT_MODEL)
     sys_msg = (
         "You are answering questions about uploaded public-sector finance case materials. "
         "Use the provided CONTEXT to answer as accurately as possible. "
@@ -64,10 +82,10 @@ if mode == "Uploaded materials (RAG)":
 
 QUESTION:
 ---------
-{user_input}
+{question}
 """
 else:
-    context_text = case_md or ""
+    context_text = memory.context if reused else case_context(case_md, question, 3000, CHAT_MODEL)
     sys_msg = (
         "You are answering questions about the following case study. "
         "Base your answers strictly on the case study text."
@@ -78,19 +96,21 @@ else:
 
 QUESTION:
 ---------
-{user_input}
+{question}
 """
+memory.context, memory.context_key = context_text, context_key
 
-assistant_reply = chat(
-    [
-        {"role": "system", "content": sys_msg},
-        {"role": "user", "content": prompt},
-    ]
-)
+with st.chat_message("assistant"):
+    assistant_reply = st.write_stream(
+        chat_stream(memory.messages(sys_msg) + [{"role": "user", "content": prompt}])
+    )
 
-st.session_state["chat_history"].append(("assistant", assistant_reply))
-st.chat_message("assistant").markdown(assistant_reply)
+# Only the question is remembered, not the context block that came with it.
+memory.add("user", user_input)
+memory.add("assistant", assistant_reply)
 
+if reused:
+    st.caption("Follow-up detected: reused the context from the previous question.")
 if mode == "Uploaded materials (RAG)":
     with st.expander("Show retrieved context (from uploaded materials)"):
         st.markdown(context_text)
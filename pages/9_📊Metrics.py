@@ -0,0 +1,58 @@
+import pandas as pd
+import streamlit as st
+from core.auth import require_admin, require_password
+from core.metrics import current_session_id, prometheus_text, reset, snapshot
+
+st.set_page_config(page_title="Metrics", page_icon="📊", layout="wide")
+require_password()
+require_admin()
+
+st.title("📊 Admin — Performance Metrics")
+
+st.markdown(
+    "Timings and counters for chat, image, embedding, extraction and index calls. "
+    "**Process** covers every session served by this app instance since it started; "
+    "**This session** covers only your browser session."
+)
+
+def show(rows, empty_msg):
+    if rows:
+        # Missing fields stay NaN: filling with "" would mix types in numeric columns.
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    else:
+        st.caption(empty_msg)
+
+tab_process, tab_session, tab_caches = st.tabs(["Process", "This session", "Caches"])
+
+with tab_process:
+    show(snapshot(), "Nothing recorded yet.")
+
+with tab_session:
+    show(snapshot(current_session_id()), "Nothing recorded for this session yet.")
+
+with tab_caches:
+    from core.blobs import get_blob_store
+    from core.cache import get_response_cache
+    from core.rag import embedding_cache_stats, query_cache_stats
+
+    caches = {"embeddings (disk)": embedding_cache_stats(), "chat responses (disk)": get_response_cache().stats()}
+    caches.update(query_cache_stats())
+    caches["image blobs (disk)"] = get_blob_store().stats()
+    show([{"cache": name, **stats} for name, stats in caches.items()], "No cache activity yet.")
+
+st.divider()
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button(
+        "⬇️ Export (Prometheus text format)",
+        data=prometheus_text(),
+        file_name="leapscribe_metrics.prom",
+        mime="text/plain",
+    )
+with col2:
+    if st.button("🧹 Reset metrics"):
+        reset()
+        st.rerun()
+
+with st.expander("Preview Prometheus export"):
+    st.code(prometheus_text(), language="text")